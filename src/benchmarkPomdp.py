@@ -0,0 +1,142 @@
+
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pomdpNumpy
+import pomdpDomains
+
+
+domains={'tiger': lambda seed: pomdpDomains.tiger(),
+         'hallway': lambda seed: pomdpDomains.hallway(),
+         'rockSample(4,4)': lambda seed: pomdpDomains.rockSample(4, 4, seed),
+         'tag': lambda seed: pomdpDomains.tag()}
+
+
+scales={'small': {'beliefNumber': 64, 'domains': ['tiger', 'hallway', 'rockSample(4,4)'], 'randomStates': [20, 100], 
+                  'sparseStates': [1000], 'expansionNumber': 2},
+        'medium': {'beliefNumber': 512, 'domains': sorted(domains), 'randomStates': [100, 500], 
+                   'sparseStates': [10000], 'expansionNumber': 3},
+        'large': {'beliefNumber': 2048, 'domains': sorted(domains), 'randomStates': [500, 2000], 
+                  'sparseStates': [50000], 'expansionNumber': 4}}
+
+
+def measure(function, repeat=3):
+    times=[]
+    for i in range(repeat):
+        start=time.perf_counter()
+        function()
+        times.append(time.perf_counter()-start)
+    tracemalloc.start()
+    try:
+        function()
+        peakMemory=tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(times), 'peakMemory': peakMemory}
+
+
+def initialValueFunction(rewardMinimum, gamma, stateNumber):
+    return {'action': 0, 'alpha': np.full((1, stateNumber), rewardMinimum/(1-gamma))}
+
+
+def randomBeliefs(stateNumber, beliefNumber, seed):
+    return np.random.RandomState(seed).dirichlet(np.ones(stateNumber), beliefNumber)
+
+
+def benchmarkDenseModel(name, model, beliefNumber, expansionNumber, seed=0, repeat=3):
+    transitionMatrix, observationMatrix, rewardMatrix, gamma=(model['transitionMatrix'], model['observationMatrix'],
+                                                              model['rewardMatrix'], model['gamma'])
+    stateNumber, actionNumber, observationNumber=observationMatrix.shape
+    compiled=pomdpNumpy.CompiledModel(transitionMatrix, rewardMatrix, observationMatrix)
+    se=pomdpNumpy.StateEstimator(compiled)
+    backupEngine=pomdpNumpy.BatchBackup(compiled, gamma=gamma)
+    improve=pomdpNumpy.Improve(backupEngine)
+    expand=pomdpNumpy.Expand(se, compiled, pomdpNumpy.furthestB)
+    V=initialValueFunction(rewardMatrix.min(), gamma, stateNumber)
+    B=randomBeliefs(stateNumber, beliefNumber, seed)
+    VImproved=improve(V, B)
+    branchNumber=beliefNumber*actionNumber*observationNumber
+    singleUpdates=[(b, a, o) for b in B[:8] for a in range(actionNumber) for o in range(observationNumber)]
+    cases=[('StateEstimator', lambda: [se(b, a, o) for b, a, o in singleUpdates], len(singleUpdates), 'beliefUpdates'),
+           ('StateEstimator.batchUpdate', lambda: se.batchUpdate(B), branchNumber, 'beliefUpdates'),
+           ('BatchBackup', lambda: backupEngine(VImproved, B), beliefNumber, 'backups'),
+           ('Improve', lambda: improve(V, B), beliefNumber, 'beliefs'),
+           ('Expand', lambda: expand(B), branchNumber, 'beliefUpdates'),
+           ('PBVI', lambda: pomdpNumpy.PBVI(improve, expand, pomdpNumpy.getPolicy, V, expansionNumber)(B[:1]), 1, 'solves')]
+    return [record(name, stateNumber, actionNumber, observationNumber, beliefNumber, case, measure(function, repeat), work, unit)
+            for case, function, work, unit in cases]
+
+
+def benchmarkSparseModel(name, model, beliefNumber, seed=0, repeat=3):
+    se=pomdpNumpy.SparseStateEstimator(model)
+    backupEngine=pomdpNumpy.SparseBatchBackup(model, 0.95)
+    V=initialValueFunction(-1, 0.95, model.stateNumber)
+    B=pomdpNumpy.sp.csr_matrix(pomdpNumpy.sp.random(beliefNumber, model.stateNumber, density=min(1, 8/model.stateNumber),
+                                                    random_state=seed, format='csr'))
+    B=pomdpNumpy.sp.diags(1/np.maximum(np.asarray(B.sum(axis=1)).ravel(), 1e-12)) @ B
+    branchNumber=beliefNumber*model.actionNumber*model.observationNumber
+    cases=[('SparseStateEstimator.batchUpdate', lambda: se.batchUpdate(B), branchNumber, 'beliefUpdates'),
+           ('SparseBatchBackup', lambda: backupEngine(V, B), beliefNumber, 'backups')]
+    return [record(name, model.stateNumber, model.actionNumber, model.observationNumber, beliefNumber, case,
+                   measure(function, repeat), work, unit) for case, function, work, unit in cases]
+
+
+def record(name, stateNumber, actionNumber, observationNumber, beliefNumber, case, measured, work, unit):
+    return {'model': name, 'stateNumber': stateNumber, 'actionNumber': actionNumber, 'observationNumber': observationNumber,
+            'beliefNumber': beliefNumber, 'case': case, 'seconds': measured['seconds'], 'peakMemory': measured['peakMemory'],
+            'throughput': work/measured['seconds'] if measured['seconds'] > 0 else float('inf'), 'unit': unit+'/s'}
+
+
+def models(scale, seed):
+    for name in scales[scale]['domains']:
+        yield name, domains[name](seed)
+    for stateNumber in scales[scale]['randomStates']:
+        yield 'randomDense(%d)' % stateNumber, pomdpDomains.randomPOMDP(stateNumber, 4, 4, seed=seed)
+        yield 'randomSparse(%d)' % stateNumber, pomdpDomains.randomPOMDP(stateNumber, 4, 4, 4, 2, seed=seed)
+
+
+def runBenchmarks(scale='small', seed=0, repeat=3):
+    setting=scales[scale]
+    results=[]
+    for name, model in models(scale, seed):
+        results+=benchmarkDenseModel(name, model, setting['beliefNumber'], setting['expansionNumber'], seed, repeat)
+    for stateNumber in setting['sparseStates']:
+        model=pomdpDomains.randomSparseModel(stateNumber, 4, 4, 4, 2, seed)
+        results+=benchmarkSparseModel('sparseModel(%d)' % stateNumber, model, setting['beliefNumber'], seed, repeat)
+    return results
+
+
+def environment():
+    try:
+        commit=subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit=None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+
+def main(arguments=None):
+    parser=argparse.ArgumentParser(description='Benchmark the PBVI solver on synthetic and classic POMDPs.')
+    parser.add_argument('--scale', choices=sorted(scales), default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results as JSON to this path instead of stdout')
+    arguments=parser.parse_args(arguments)
+    report={'environment': environment(), 'scale': arguments.scale, 'seed': arguments.seed,
+            'results': runBenchmarks(arguments.scale, arguments.seed, arguments.repeat)}
+    text=json.dumps(report, indent=2)
+    if arguments.output is None:
+        sys.stdout.write(text+'\n')
+    else:
+        with open(arguments.output, 'w') as f:
+            f.write(text)
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,180 @@
+
+
+import itertools
+import numpy as np
+import pomdpNumpy
+
+
+def randomPOMDP(stateNumber, actionNumber, observationNumber, successorNumber=None, observationSupport=None, seed=0, gamma=0.95):
+    random=np.random.RandomState(seed)
+    transitionMatrix=randomStochastic(random, (stateNumber, actionNumber), stateNumber, successorNumber)
+    observationMatrix=randomStochastic(random, (stateNumber, actionNumber), observationNumber, observationSupport)
+    rewardMatrix=np.repeat(random.uniform(-1, 1, (stateNumber, actionNumber, 1)), stateNumber, axis=2)
+    return {'transitionMatrix':transitionMatrix, 'observationMatrix':observationMatrix, 'rewardMatrix':rewardMatrix, 'gamma':gamma}
+
+
+def randomStochastic(random, shape, outcomeNumber, supportNumber=None):
+    probability=np.zeros(shape+(outcomeNumber,))
+    if supportNumber is None:
+        probability[...]=random.dirichlet(np.ones(outcomeNumber), shape)
+        return probability
+    rows=probability.reshape(-1, outcomeNumber)
+    for row in rows:
+        support=random.choice(outcomeNumber, supportNumber, replace=False)
+        row[support]=random.dirichlet(np.ones(supportNumber))
+    return probability
+
+
+def randomSparseModel(stateNumber, actionNumber, observationNumber, successorNumber, observationSupport=1, seed=0):
+    random=np.random.RandomState(seed)
+
+    def sparseStochastic(columnNumber, supportNumber):
+        rows=np.repeat(np.arange(stateNumber), supportNumber)
+        columns=np.array([random.choice(columnNumber, supportNumber, replace=False) for s in range(stateNumber)]).ravel()
+        probability=random.dirichlet(np.ones(supportNumber), stateNumber).ravel()
+        return pomdpNumpy.sp.csr_matrix((probability, (rows, columns)), shape=(stateNumber, columnNumber))
+
+    transitionMatrices=[sparseStochastic(stateNumber, successorNumber) for a in range(actionNumber)]
+    observationMatrices=[sparseStochastic(observationNumber, observationSupport) for a in range(actionNumber)]
+    rewardMatrices=[pomdpNumpy.sp.diags(random.uniform(-1, 1, stateNumber)) @ (T != 0) for T in transitionMatrices]
+    return pomdpNumpy.SparseModel(transitionMatrices, rewardMatrices, observationMatrices)
+
+
+def tiger(gamma=0.95):
+    transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                               [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+    rewardMatrix=np.array([[[-100, -100], [10, 10],     [-1, -1]],
+                           [[10, 10],     [-100, -100], [-1, -1]]], dtype=float)
+    observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                [[0, 0, 1], [0, 0, 1], [0.15, 0.85, 0]]])
+    return {'transitionMatrix':transitionMatrix, 'observationMatrix':observationMatrix, 'rewardMatrix':rewardMatrix, 'gamma':gamma}
+
+
+def rockSample(size=4, rockNumber=4, seed=0, halfEfficiencyDistance=20, gamma=0.95):
+    random=np.random.RandomState(seed)
+    cells=list(itertools.product(range(size), range(size)))
+    rocks=[cells[index] for index in random.choice(len(cells), rockNumber, replace=False)]
+    states=list(itertools.product(cells, itertools.product((0, 1), repeat=rockNumber)))
+    stateIndex={state: index for index, state in enumerate(states)}
+    terminal=len(states)
+    stateNumber, actionNumber, observationNumber=len(states)+1, 5+rockNumber, 3
+    transitionMatrix=np.zeros((stateNumber, actionNumber, stateNumber))
+    rewardMatrix=np.zeros((stateNumber, actionNumber, stateNumber))
+    observationMatrix=np.zeros((stateNumber, actionNumber, observationNumber))
+    observationMatrix[:, :, 0]=1
+    moves=[(0, 1), (0, -1), (1, 0), (-1, 0)]
+    for (position, rockState), s in stateIndex.items():
+        for a, (dx, dy) in enumerate(moves):
+            x, y=position[0]+dx, position[1]+dy
+            if x == size:
+                transitionMatrix[s, a, terminal]=1
+                rewardMatrix[s, a, terminal]=10
+            elif 0 <= x < size and 0 <= y < size:
+                transitionMatrix[s, a, stateIndex[((x, y), rockState)]]=1
+            else:
+                transitionMatrix[s, a, s]=1
+                rewardMatrix[s, a, s]=-100
+        if position in rocks:
+            rock=rocks.index(position)
+            sampledState=stateIndex[(position, rockState[:rock]+(0,)+rockState[rock+1:])]
+            transitionMatrix[s, 4, sampledState]=1
+            rewardMatrix[s, 4, sampledState]=10 if rockState[rock] else -10
+        else:
+            transitionMatrix[s, 4, s]=1
+            rewardMatrix[s, 4, s]=-100
+        for rock, rockPosition in enumerate(rocks):
+            a=5+rock
+            transitionMatrix[s, a, s]=1
+            efficiency=2**(-np.hypot(position[0]-rockPosition[0], position[1]-rockPosition[1])/halfEfficiencyDistance)
+            accuracy=(1+efficiency)/2
+            observationMatrix[s, a]=[0, accuracy, 1-accuracy] if rockState[rock] else [0, 1-accuracy, accuracy]
+    transitionMatrix[terminal, :, terminal]=1
+    return {'transitionMatrix':transitionMatrix, 'observationMatrix':observationMatrix, 'rewardMatrix':rewardMatrix, 'gamma':gamma}
+
+
+hallwayLayout=['#########',
+               '#.......#',
+               '#.##.##.#',
+               '#...G...#',
+               '#########']
+
+
+def hallway(layout=hallwayLayout, moveSuccess=0.8, observationAccuracy=0.9, gamma=0.95):
+    cells=[(row, column) for row, line in enumerate(layout) for column, cell in enumerate(line) if cell != '#']
+    headings=[(-1, 0), (0, 1), (1, 0), (0, -1)]
+    states=list(itertools.product(range(len(cells)), range(len(headings))))
+    stateIndex={state: index for index, state in enumerate(states)}
+    cellIndex={cell: index for index, cell in enumerate(cells)}
+    goalStates=[stateIndex[(cellIndex[cell], h)] for cell in cells if layout[cell[0]][cell[1]] == 'G' for h in range(len(headings))]
+    stateNumber, actionNumber, observationNumber=len(states), 5, 17
+    transitionMatrix=np.zeros((stateNumber, actionNumber, stateNumber))
+    rewardMatrix=np.zeros((stateNumber, actionNumber, stateNumber))
+    observationMatrix=np.zeros((stateNumber, actionNumber, observationNumber))
+    restart=np.ones(stateNumber)/stateNumber
+    for (c, h), s in stateIndex.items():
+        if s in goalStates:
+            transitionMatrix[s, :, :]=restart
+            rewardMatrix[s, :, :]=1
+            observationMatrix[s, :, 16]=1
+            continue
+        row, column=cells[c]
+        forward=(row+headings[h][0], column+headings[h][1])
+        successors=[cellIndex.get(forward, c), c, c, c, c]
+        successorHeadings=[h, h, (h+3)%4, (h+1)%4, (h+2)%4]
+        for a in range(actionNumber):
+            transitionMatrix[s, a, stateIndex[(successors[a], successorHeadings[a])]]+=moveSuccess
+            transitionMatrix[s, a, s]+=1-moveSuccess
+        walls=sum(2**k for k in range(len(headings))
+                  if (row+headings[(h+k)%4][0], column+headings[(h+k)%4][1]) not in cellIndex)
+        observationMatrix[s, :, :16]=(1-observationAccuracy)/16
+        observationMatrix[s, :, walls]+=observationAccuracy
+    return {'transitionMatrix':transitionMatrix, 'observationMatrix':observationMatrix, 'rewardMatrix':rewardMatrix, 'gamma':gamma}
+
+
+tagLayout=['#####...##',
+           '#####...##',
+           '#####...##',
+           '..........',
+           '..........']
+
+
+def tag(layout=tagLayout, opponentMoveAway=0.8, gamma=0.95):
+    cells=[(row, column) for row, line in enumerate(layout) for column, cell in enumerate(line) if cell != '#']
+    cellIndex={cell: index for index, cell in enumerate(cells)}
+    moves=[(-1, 0), (1, 0), (0, 1), (0, -1)]
+
+    def move(cell, direction):
+        return cellIndex.get((cell[0]+direction[0], cell[1]+direction[1]), cellIndex[cell])
+
+    cellNumber=len(cells)
+    tagged=cellNumber*cellNumber
+    stateNumber, actionNumber, observationNumber=tagged+1, 5, cellNumber+1
+    transitionMatrix=np.zeros((stateNumber, actionNumber, stateNumber))
+    rewardMatrix=np.zeros((stateNumber, actionNumber, stateNumber))
+    observationMatrix=np.zeros((stateNumber, actionNumber, observationNumber))
+    for robot, opponent in itertools.product(range(cellNumber), repeat=2):
+        s=robot*cellNumber+opponent
+        observationMatrix[s, :, cellNumber if robot == opponent else robot]=1
+        away=[move(cells[opponent], direction) for direction in moves
+              if np.abs(np.subtract(cells[move(cells[opponent], direction)], cells[robot])).sum()
+              > np.abs(np.subtract(cells[opponent], cells[robot])).sum()]
+        opponentNext=np.zeros(cellNumber)
+        opponentNext[opponent]+=1-opponentMoveAway if away else 1
+        for cell in away:
+            opponentNext[cell]+=opponentMoveAway/len(away)
+        for a in range(actionNumber):
+            if a == 4:
+                if robot == opponent:
+                    transitionMatrix[s, a, tagged]=1
+                    rewardMatrix[s, a, tagged]=10
+                    continue
+                robotNext=robot
+                rewardMatrix[s, a, :]=-10
+            else:
+                robotNext=move(cells[robot], moves[a])
+                rewardMatrix[s, a, :]=-1
+            transitionMatrix[s, a, robotNext*cellNumber:(robotNext+1)*cellNumber]=opponentNext
+    transitionMatrix[tagged, :, tagged]=1
+    rewardMatrix[tagged]=0
+    observationMatrix[tagged, :, cellNumber]=1
+    return {'transitionMatrix':transitionMatrix, 'observationMatrix':observationMatrix, 'rewardMatrix':rewardMatrix, 'gamma':gamma}
@@ -1,61 +1,889 @@
 
 
+import os
+import csv
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
 import numpy as np
+try:
+    import scipy.sparse as sp
+    from scipy.spatial import cKDTree
+except ImportError:
+    sp=None
+    cKDTree=None
+try:
+    import resource
+except ImportError:
+    resource=None
 
 
-class StateEstimator(object):
+def isSparse(x):
+    return sp is not None and sp.issparse(x)
+
+
+def rowDot(B, X):
+    if isSparse(B):
+        return np.asarray(B.multiply(X).sum(axis=1)).ravel()
+    return np.einsum('ns,ns->n', B, X)
+
+
+def reserve(buffer, size, limit=None):
+    if size <= buffer.shape[0]:
+        return buffer
+    capacity=max(size, 2*buffer.shape[0])
+    if limit is not None:
+        capacity=max(size, min(capacity, limit))
+    grown=np.empty((capacity,)+buffer.shape[1:], dtype=buffer.dtype)
+    grown[:buffer.shape[0]]=buffer
+    return grown
+
+
+def beliefArray(B):
+    if isinstance(B, BeliefSet):
+        return B.view()
+    return B
+
+
+def checkedArray(name, array, dtype):
+    array=np.asarray(array)
+    if not (np.issubdtype(array.dtype, np.integer) or np.issubdtype(array.dtype, np.floating) or array.dtype == bool):
+        raise ValueError('%s must be real-valued, got dtype %s' % (name, array.dtype))
+    array=array.astype(dtype, copy=False)
+    if not np.isfinite(array).all():
+        raise ValueError('%s contains non-finite values' % name)
+    return array
+
+
+def checkStochastic(name, probability, tolerance):
+    if (probability < 0).any() or not np.allclose(probability.sum(axis=-1), 1, atol=tolerance):
+        raise ValueError('%s rows must be probability distributions' % name)
+
+
+class CompiledModel(object):
     
-    def __init__(self, transitionMatrix, observationMatrix):
+    def __init__(self, transitionMatrix, rewardMatrix=None, observationMatrix=None, dtype=np.float64, tolerance=1e-6, 
+                 checkProbabilities=False):
+        transitionMatrix=checkedArray('transitionMatrix', transitionMatrix, dtype)
+        observationMatrix=checkedArray('observationMatrix', observationMatrix, dtype)
+        if transitionMatrix.ndim != 3 or transitionMatrix.shape[0] != transitionMatrix.shape[2]:
+            raise ValueError('transitionMatrix must have shape (S, A, S), got %s' % (transitionMatrix.shape,))
+        self.stateNumber, self.actionNumber=transitionMatrix.shape[:2]
+        if observationMatrix.ndim != 3 or observationMatrix.shape[:2] != (self.stateNumber, self.actionNumber):
+            raise ValueError('observationMatrix must have shape (S, A, O), got %s' % (observationMatrix.shape,))
+        self.observationNumber=observationMatrix.shape[2]
+        if checkProbabilities:
+            checkStochastic('transitionMatrix', transitionMatrix, tolerance)
+            checkStochastic('observationMatrix', observationMatrix, tolerance)
         self.transitionMatrix=transitionMatrix
         self.observationMatrix=observationMatrix
+        self.rewardMatrix=rewardMatrix
+        self.transitions=np.ascontiguousarray(transitionMatrix.transpose(1, 0, 2))
+        self.observations=np.ascontiguousarray(observationMatrix.transpose(1, 2, 0))
+        self.observationTransitions=np.matmul(self.transitions, observationMatrix.transpose(1, 0, 2))
+        self.dtype=self.transitions.dtype
+        self.oneStepReward=None
+        if rewardMatrix is not None:
+            rewardMatrix=checkedArray('rewardMatrix', rewardMatrix, dtype)
+            if rewardMatrix.shape == transitionMatrix.shape:
+                self.oneStepReward=(rewardMatrix*transitionMatrix).sum(axis=2)
+            elif rewardMatrix.shape == transitionMatrix.shape[:2]:
+                self.oneStepReward=rewardMatrix
+            else:
+                raise ValueError('rewardMatrix must have shape (S, A, S) or (S, A), got %s' % (rewardMatrix.shape,))
+            self.oneStepReward=np.ascontiguousarray(self.oneStepReward)
+            self.rewardMatrix=rewardMatrix
+            
+            
+def compileModel(transitionMatrix, rewardMatrix=None, observationMatrix=None):
+    if isinstance(transitionMatrix, CompiledModel):
+        return transitionMatrix
+    return CompiledModel(transitionMatrix, rewardMatrix, observationMatrix)
+
+
+def modelDtype(engine):
+    model=getattr(engine, 'model', None)
+    if model is None:
+        model=getattr(getattr(engine, 'engine', None), 'model', None)
+    return model.dtype if isinstance(model, CompiledModel) else None
+
+
+class StateEstimator(object):
+    
+    def __init__(self, transitionMatrix, observationMatrix=None):
+        self.model=compileModel(transitionMatrix, None, observationMatrix)
+        self.transitionMatrix=self.model.transitionMatrix
+        self.observationMatrix=self.model.observationMatrix
         
     def __call__(self, b, a, o):
-        stateEstimateAfterTransition=np.dot(self.transitionMatrix[:, a, :].T, b)
-        observationCorrection=self.observationMatrix[:, a, o]*stateEstimateAfterTransition
+        stateEstimateAfterTransition=np.dot(np.asarray(b, dtype=self.model.dtype), self.model.transitions[a])
+        observationCorrection=self.model.observations[a, o]*stateEstimateAfterTransition
         if observationCorrection.sum()==0:
             return observationCorrection
         bPrime=observationCorrection/observationCorrection.sum()
         return bPrime
+    
+    def batchUpdate(self, B):
+        B=np.atleast_2d(np.asarray(B, dtype=self.model.dtype))
+        stateEstimateAfterTransition=np.matmul(B, self.model.transitions).transpose(1, 0, 2)
+        observationCorrection=stateEstimateAfterTransition[:, :, np.newaxis, :]*self.model.observations[np.newaxis]
+        observationProbability=observationCorrection.sum(axis=3)
+        possible=observationProbability!=0
+        bPrime=np.zeros(observationCorrection.shape, dtype=observationCorrection.dtype)
+        np.divide(observationCorrection, observationProbability[..., np.newaxis], out=bPrime, where=possible[..., np.newaxis])
+        return {'belief':bPrime, 'probability':observationProbability, 'possible':possible}
+    
+    def groupedUpdate(self, B, actions, observations):
+        B=np.atleast_2d(np.asarray(B, dtype=self.model.dtype))
+        predicted=np.empty(B.shape, dtype=B.dtype)
+        observationCorrection=np.empty(B.shape, dtype=B.dtype)
+        for a in np.unique(actions):
+            chosen=np.flatnonzero(actions == a)
+            predicted[chosen]=B[chosen] @ self.model.transitions[a]
+            observationCorrection[chosen]=predicted[chosen]*self.model.observations[a, observations[chosen]]
+        observationProbability=observationCorrection.sum(axis=1)
+        possible=observationProbability!=0
+        bPrime=np.zeros(B.shape, dtype=B.dtype)
+        np.divide(observationCorrection, observationProbability[:, np.newaxis], out=bPrime, where=possible[:, np.newaxis])
+        return {'belief':bPrime, 'predicted':predicted, 'probability':observationProbability, 'possible':possible}
+
+
+
+class SparseModel(object):
+    
+    def __init__(self, transitionMatrices, rewardMatrices, observationMatrices):
+        self.transitionMatrices=[sp.csr_matrix(T) for T in transitionMatrices]
+        self.rewardMatrices=[sp.csr_matrix(R) for R in rewardMatrices]
+        self.observationMatrices=[sp.csc_matrix(O) for O in observationMatrices]
+        self.stateNumber=self.transitionMatrices[0].shape[0]
+        self.actionNumber=len(self.transitionMatrices)
+        self.observationNumber=self.observationMatrices[0].shape[1]
+        self.oneStepReward=np.array([np.asarray(R.multiply(T).sum(axis=1)).ravel() 
+                                     for T, R in zip(self.transitionMatrices, self.rewardMatrices)]).T
+        
+        
+def toSparseModel(transitionMatrix, rewardMatrix, observationMatrix):
+    actions=range(transitionMatrix.shape[1])
+    return SparseModel([transitionMatrix[:, a, :] for a in actions], [rewardMatrix[:, a, :] for a in actions], 
+                       [observationMatrix[:, a, :] for a in actions])
+
+
+class SparseStateEstimator(object):
+    
+    def __init__(self, model):
+        self.model=model
+        
+    def __call__(self, b, a, o):
+        observationColumn=self.model.observationMatrices[a][:, o]
+        if isSparse(b):
+            observationCorrection=sp.csr_matrix(b @ self.model.transitionMatrices[a]).multiply(observationColumn.T).tocsr()
+        else:
+            observationCorrection=(self.model.transitionMatrices[a].T @ b)*observationColumn.toarray().ravel()
+        if observationCorrection.sum()==0:
+            return observationCorrection
+        bPrime=observationCorrection/observationCorrection.sum()
+        return bPrime
+    
+    def batchUpdate(self, B):
+        B=sp.csr_matrix(B)
+        beliefNumber=B.shape[0]
+        observationCorrection=[]
+        for a in range(self.model.actionNumber):
+            stateEstimateAfterTransition=B @ self.model.transitionMatrices[a]
+            for o in range(self.model.observationNumber):
+                observationColumn=self.model.observationMatrices[a][:, o]
+                observationCorrection.append(stateEstimateAfterTransition.multiply(observationColumn.T))
+        branchOrder=np.arange(beliefNumber*len(observationCorrection)).reshape(len(observationCorrection), beliefNumber).T.ravel()
+        observationCorrection=sp.vstack(observationCorrection, format='csr')[branchOrder]
+        observationProbability=np.asarray(observationCorrection.sum(axis=1)).ravel()
+        possible=observationProbability!=0
+        normalizer=np.zeros(observationProbability.shape)
+        normalizer[possible]=1/observationProbability[possible]
+        bPrime=sp.diags(normalizer) @ observationCorrection
+        shape=(beliefNumber, self.model.actionNumber, self.model.observationNumber)
+        return {'belief':bPrime.tocsr(), 'probability':observationProbability.reshape(shape), 'possible':possible.reshape(shape)}
+
+
+
+def byteSize(value):
+    if isinstance(value, dict):
+        return sum(byteSize(element) for element in value.values())
+    if isinstance(value, tuple):
+        return sum(byteSize(element) for element in value)
+    return getattr(value, 'nbytes', 0)
+
+
+def arrayKey(array, quantum=0):
+    array=np.asarray(array, dtype=np.float64)
+    if quantum > 0:
+        array=np.round(array/quantum).astype(np.int64)
+    return hashlib.blake2b((array+0).tobytes(), digest_size=16).digest()+repr(array.shape).encode()
+
+
+def cacheToken(owner):
+    token=getattr(owner, 'cacheToken', None)
+    if token is None:
+        token=owner.cacheToken=object()
+    return token
+
+
+class LRUCache(object):
+    
+    def __init__(self, maxBytes=64*2**20):
+        self.maxBytes=maxBytes
+        self.entries=OrderedDict()
+        self.bytes=0
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        self.lock=threading.Lock()
+        
+    def __getstate__(self):
+        state=self.__dict__.copy()
+        del state['lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock=threading.Lock()
+        
+    def __len__(self):
+        return len(self.entries)
+    
+    def get(self, key):
+        with self.lock:
+            entry=self.entries.get(key)
+            if entry is None:
+                self.misses+=1
+                return None
+            self.hits+=1
+            self.entries.move_to_end(key)
+            return entry[0]
+    
+    def put(self, key, value):
+        size=byteSize(value)
+        if size > self.maxBytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.bytes-=self.entries.pop(key)[1]
+            self.entries[key]=(value, size)
+            self.bytes+=size
+            while self.bytes > self.maxBytes:
+                self.bytes-=self.entries.popitem(last=False)[1][1]
+                self.evictions+=1
+            
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes=0
+        
+    def stats(self):
+        with self.lock:
+            lookups=self.hits+self.misses
+            return {'hits':self.hits, 'misses':self.misses, 'evictions':self.evictions, 'entries':len(self.entries), 
+                    'bytes':self.bytes, 'maxBytes':self.maxBytes, 'hitRate':self.hits/lookups if lookups != 0 else None}
+
+
+def readOnly(array):
+    array.flags.writeable=False
+    return array
+
+
+class CachedStateEstimator(object):
+    
+    def __init__(self, se, cache=None, quantum=1e-9):
+        self.se=se
+        self.model=getattr(se, 'model', None)
+        self.cache=LRUCache() if cache is None else cache
+        self.quantum=quantum
+        self.sparse=isinstance(se, SparseStateEstimator)
+        self.token=cacheToken(se if self.model is None else self.model)
+        if getattr(se, 'batchUpdate', None) is None:
+            self.batchUpdate=None
+        
+    def __call__(self, b, a, o):
+        if isSparse(b):
+            return self.se(b, a, o)
+        key=('update', self.token, arrayKey(b, self.quantum), a, o)
+        bPrime=self.cache.get(key)
+        if bPrime is None:
+            bPrime=readOnly(np.array(self.se(b, a, o)))
+            self.cache.put(key, bPrime)
+        return bPrime
+    
+    def batchUpdate(self, B):
+        if self.sparse or isSparse(B):
+            return self.se.batchUpdate(B)
+        B=np.atleast_2d(beliefArray(B))
+        keys=[('batch', self.token, arrayKey(b, self.quantum)) for b in B]
+        rows=[self.cache.get(key) for key in keys]
+        missing=[n for n, row in enumerate(rows) if row is None]
+        if len(missing) != 0:
+            updated=self.se.batchUpdate(B[missing])
+            for i, n in enumerate(missing):
+                rows[n]={name: readOnly(value[i].copy()) for name, value in updated.items()}
+                self.cache.put(keys[n], rows[n])
+        if len(rows) == 0:
+            return self.se.batchUpdate(B)
+        return {name: np.stack([row[name] for row in rows]) for name in rows[0]}
 
 
 
 
+
+class BeliefSet(object):
+    
+    def __init__(self, B, dtype=None):
+        B=np.atleast_2d(B)
+        if dtype is None:
+            dtype=np.result_type(B, np.float32)
+        self.buffer=np.empty((max(2*B.shape[0], 1), B.shape[1]), dtype=dtype)
+        self.size=0
+        self.maxSize=None
+        self.append(B)
+        
+    def __len__(self):
+        return self.size
+    
+    def __iter__(self):
+        return iter(self.view())
+    
+    def __getitem__(self, index):
+        return self.view()[index]
+    
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.view()
+        return self.view().astype(dtype)
+    
+    def __repr__(self):
+        return 'BeliefSet('+repr(self.view())+')'
+    
+    @property
+    def shape(self):
+        return (self.size, self.buffer.shape[1])
+    
+    @property
+    def dtype(self):
+        return self.buffer.dtype
+    
+    def view(self):
+        return self.buffer[:self.size]
+    
+    def append(self, B):
+        B=np.atleast_2d(B)
+        size=self.size+B.shape[0]
+        self.buffer=reserve(self.buffer, size, self.maxSize)
+        self.buffer[self.size:size]=B
+        self.size=size
+        
+    def limit(self, maxSize):
+        self.maxSize=maxSize
+        capacity=max(maxSize, self.size, 1)
+        if self.buffer.shape[0] > capacity:
+            self.buffer=self.buffer[:capacity].copy()
+        
+    def copy(self):
+        return BeliefSet(self.view(), self.dtype)
+
+    
+def expired(deadline):
+    return deadline is not None and time.perf_counter() >= deadline
+
+
+def peakMemory():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bellmanResidual(V, VNew, B):
+    B=beliefArray(B)
+    value=np.asarray(B @ np.asarray(V['alpha']).T).max(axis=1)
+    valueNew=np.asarray(B @ np.asarray(VNew['alpha']).T).max(axis=1)
+    return float(abs(valueNew-value).max())
+
+
+def verifyValues(V, B, backupEngine):
+    B=np.asarray(beliefArray(B), dtype=np.float64)
+    alpha=np.asarray(V['alpha'], dtype=np.float64)
+    value=(B @ alpha.T).max(axis=1)
+    storedValue=(B.astype(V['alpha'].dtype) @ np.asarray(V['alpha']).T).max(axis=1)
+    backedUp=backupEngine({'action':V['action'], 'alpha':alpha}, B)
+    return {'value':value, 'roundingError':float(np.max(abs(value-storedValue), initial=0)), 
+            'bellmanResidual':float(np.max(abs(rowDot(B, backedUp['alpha'])-value), initial=0))}
+
+
+class SolverStats(object):
+    
+    fields=['iteration', 'improveTime', 'expandTime', 'backupTime', 'beliefUpdateTime', 'sweepNumber', 'backupNumber', 
+            'beliefUpdateNumber', 'alphaNumber', 'beliefNumber', 'expandedBeliefNumber', 'bellmanResidual', 'peakMemory']
+    
+    def __init__(self, callback=None):
+        self.callback=callback
+        self.records=[]
+        
+    def record(self, **record):
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+            
+    def toJSON(self, path=None):
+        text=json.dumps(self.records, indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+    
+    def toCSV(self, path=None):
+        output=io.StringIO()
+        writer=csv.DictWriter(output, self.fields, extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(self.records)
+        if path is not None:
+            with open(path, 'w', newline='') as f:
+                f.write(output.getvalue())
+        return output.getvalue()
+
     
 class PBVI(object):
     
-    def __init__(self, improve, expand, getPolicy, V, expansionNumber):
+    def __init__(self, improve, expand, getPolicy, V, expansionNumber, stats=None, timeBudget=None, dtype=None, 
+                 memoryBudget=None, beliefShare=0.5, verifyEngine=None):
         self.improve=improve
         self.expand=expand
         self.getPolicy=getPolicy
         self.V=V
         self.expansionNumber=expansionNumber
+        self.stats=stats
+        self.timeBudget=timeBudget
+        self.dtype=getattr(improve, 'dtype', None) if dtype is None else dtype
+        self.memoryBudget=memoryBudget
+        self.beliefShare=beliefShare
+        self.verifyEngine=verifyEngine
+        self.verification=None
         
-    def __call__(self, B):
-        V=self.V
-        for i in range(self.expansionNumber):
-            V=self.improve(V, B)
-            B=self.expand(B)
+    def __call__(self, B, state=None):
+        V=self.V if state is None else state['V']
+        for V in self.solve(B, state):
+            pass
         return V
     
+    def start(self, B, state):
+        if state is None:
+            return self.V, BeliefSet(B, self.dtype) if not isSparse(B) else B, 0
+        if isSparse(state['B']):
+            B=sp.csr_matrix(B)
+            new=[n for n in range(B.shape[0]) if l1Distance(state['B'], B[n]).min(initial=np.inf) > 0]
+            return state['V'], sp.vstack([state['B'], B[new]], format='csr'), state['B'].shape[0]
+        BStart=BeliefSet(state['B'], self.dtype)
+        B=B.toarray() if isSparse(B) else np.atleast_2d(beliefArray(B))
+        B=B[minL1Distance(B, BStart.view()) > 0]
+        BStart.append(B)
+        return state['V'], BStart, len(BStart)-B.shape[0]
+    
+    def solve(self, B, state=None):
+        deadline=None if self.timeBudget is None else time.perf_counter()+self.timeBudget
+        if hasattr(self.improve, 'deadline'):
+            self.improve.deadline=deadline
+        V, B, inherited=self.start(B, state)
+        self.applyMemoryBudget(B)
+        self.state={'V':V, 'B':B}
+        self.verification=None
+        for i in range(self.expansionNumber):
+            if expired(deadline):
+                break
+            if self.stats is None:
+                V=self.improve(V, B)
+                if not expired(deadline):
+                    B=self.expandFrom(B, inherited, V)
+            else:
+                V, B=self.recordIteration(i, V, B, deadline, inherited)
+            self.state={'V':V, 'B':B}
+            yield V
+        if self.verifyEngine is not None:
+            self.verification=verifyValues(V, B, self.verifyEngine)
+            
+    def applyMemoryBudget(self, B):
+        if self.memoryBudget is None:
+            return
+        rowBytes=B.shape[1]*np.dtype(self.dtype or B.dtype).itemsize
+        rowNumber=int(self.memoryBudget//rowBytes)
+        maxBeliefs=int(rowNumber*self.beliefShare)
+        if hasattr(self.expand, 'maxBeliefs'):
+            self.expand.maxBeliefs=maxBeliefs
+        if isinstance(B, BeliefSet):
+            B.limit(maxBeliefs)
+        if hasattr(self.improve, 'maxAlphas'):
+            self.improve.maxAlphas=max(rowNumber-maxBeliefs, 1)
+            
+    def expandFrom(self, B, inherited, V=None):
+        if hasattr(self.expand, 'V'):
+            self.expand.V=V
+        if inherited == 0:
+            return self.expand(B)
+        return self.expand(B, inherited)
+    
+    def recordIteration(self, iteration, V, B, deadline=None, inherited=0):
+        beliefNumber=B.shape[0]
+        start=time.perf_counter()
+        VNew=self.improve(V, B)
+        improveTime=time.perf_counter()-start
+        residual=bellmanResidual(V, VNew, B)
+        BNew, expandTime=B, 0
+        if not expired(deadline):
+            start=time.perf_counter()
+            BNew=self.expandFrom(B, inherited, VNew)
+            expandTime=time.perf_counter()-start
+        self.stats.record(iteration=iteration, improveTime=improveTime, expandTime=expandTime, 
+                          backupTime=getattr(self.improve, 'backupTime', None), 
+                          beliefUpdateTime=getattr(self.expand, 'beliefUpdateTime', None), 
+                          sweepNumber=getattr(self.improve, 'sweepNumber', None), 
+                          backupNumber=getattr(self.improve, 'backupNumber', None), 
+                          beliefUpdateNumber=getattr(self.expand, 'beliefUpdateNumber', None), 
+                          alphaNumber=len(VNew['alpha']), beliefNumber=beliefNumber, expandedBeliefNumber=BNew.shape[0], 
+                          bellmanResidual=residual, peakMemory=peakMemory())
+        return VNew, BNew
+    
+class ValueFunction(object):
+    
+    def __init__(self, alpha, action, tolerance=0, dtype=None, maxSize=None):
+        alpha=np.atleast_2d(alpha)
+        action=np.broadcast_to(action, alpha.shape[:1])
+        self.tolerance=tolerance
+        self.maxSize=maxSize
+        if dtype is None:
+            dtype=np.result_type(alpha, np.float32)
+        capacity=max(2*alpha.shape[0], 1)
+        if maxSize is not None:
+            capacity=max(min(capacity, maxSize), alpha.shape[0], 1)
+        self.alphaBuffer=np.empty((capacity, alpha.shape[1]), dtype=dtype)
+        self.actionBuffer=np.empty(self.alphaBuffer.shape[0], dtype=action.dtype)
+        self.size=0
+        self.keys=set()
+        self.append(alpha, action)
+        
+    def __len__(self):
+        return self.size
+    
+    def __repr__(self):
+        return repr({'action':self['action'], 'alpha':self['alpha']})
+    
+    def __getitem__(self, name):
+        if name == 'alpha':
+            return self.alphaBuffer[:self.size]
+        if name == 'action':
+            return self.actionBuffer[:self.size]
+        raise KeyError(name)
+    
+    def __contains__(self, alpha):
+        return self.key(alpha) in self.keys
+    
+    def key(self, alpha):
+        alpha=np.asarray(alpha, dtype=self.alphaBuffer.dtype)
+        if self.tolerance > 0:
+            return np.round(alpha/self.tolerance).astype(np.int64).tobytes()
+        return (alpha+0).tobytes()
+    
+    def append(self, alpha, action):
+        alpha=np.atleast_2d(alpha)
+        action=np.broadcast_to(action, alpha.shape[:1])
+        size=self.size+alpha.shape[0]
+        self.alphaBuffer=reserve(self.alphaBuffer, size, self.maxSize)
+        self.actionBuffer=reserve(self.actionBuffer, size, self.maxSize)
+        self.alphaBuffer[self.size:size]=alpha
+        self.actionBuffer[self.size:size]=action
+        self.size=size
+        self.keys.update(self.key(element) for element in alpha)
+        
+    def copy(self):
+        return ValueFunction(self['alpha'], self['action'], self.tolerance, self.alphaBuffer.dtype, self.maxSize)
+    
+    def keep(self, index):
+        self.replace(self['alpha'][index], self['action'][index])
+        
+    def replace(self, alpha, action):
+        alpha=np.atleast_2d(alpha)
+        capacity=max(alpha.shape[0], 1) if self.maxSize is None else max(self.maxSize, alpha.shape[0], 1)
+        if self.maxSize is not None and self.alphaBuffer.shape[0] > capacity:
+            self.alphaBuffer=np.empty((capacity, self.alphaBuffer.shape[1]), dtype=self.alphaBuffer.dtype)
+            self.actionBuffer=np.empty(capacity, dtype=self.actionBuffer.dtype)
+        self.size=0
+        self.keys=set()
+        self.append(alpha, action)
+        
+    def dominated(self, blockSize=256):
+        alpha=self['alpha']
+        dominated=np.zeros(self.size, dtype=bool)
+        for start in range(0, self.size, blockSize):
+            block=alpha[start:start+blockSize]
+            weaklyDominates=(alpha[np.newaxis, :, :] >= block[:, np.newaxis, :]).all(axis=2)
+            strictlyBetter=(alpha[np.newaxis, :, :] > block[:, np.newaxis, :]).any(axis=2)
+            earlier=np.arange(self.size)[np.newaxis, :] < np.arange(start, start+block.shape[0])[:, np.newaxis]
+            dominated[start:start+block.shape[0]]=(weaklyDominates & (strictlyBetter | earlier)).any(axis=1)
+        return dominated
+    
+    def prune(self, B=None, dominated=True, unused=True):
+        B=beliefArray(B)
+        keep=np.ones(self.size, dtype=bool)
+        if dominated:
+            keep&=~self.dominated()
+        if unused and B is not None and B.shape[0] != 0:
+            maximal=np.zeros(self.size, dtype=bool)
+            maximal[np.argmax(B @ self['alpha'].T, axis=1)]=True
+            keep&=maximal
+        removedNumber=int(self.size-keep.sum())
+        if removedNumber != 0:
+            self.keep(keep)
+        return removedNumber
+    
+    def truncate(self, B, maxNumber):
+        if self.size <= maxNumber:
+            return 0
+        B=beliefArray(B)
+        usage=np.bincount(np.argmax(np.asarray(B @ self['alpha'].T), axis=1), minlength=self.size)
+        keep=np.zeros(self.size, dtype=bool)
+        keep[np.argsort(-usage, kind='stable')[:maxNumber]]=True
+        removedNumber=self.size-maxNumber
+        self.keep(keep)
+        return removedNumber
+
+    
 class Improve(object):
     
-    def __init__(self, backup):
+    def __init__(self, backup, tolerance=0, pruneDominated=False, pruneUnused=False, epsilon=None, maxSweeps=None, 
+                 dtype=None, maxAlphas=None):
         self.backup=backup
+        self.backupEngine=backup if isinstance(backup, (BatchBackup, ParallelBackup)) else getattr(backup, 'backupEngine', None)
+        self.tolerance=tolerance
+        self.pruneDominated=pruneDominated
+        self.pruneUnused=pruneUnused
+        self.epsilon=epsilon
+        self.maxSweeps=maxSweeps
+        self.dtype=modelDtype(self.backupEngine) if dtype is None else dtype
+        self.maxAlphas=maxAlphas
+        self.deadline=None
+        self.prunedNumber=0
+        self.truncatedNumber=0
+        self.sweepNumber=0
+        self.backupNumber=0
+        self.backupTime=0
+        self.residual=None
+        
+    def start(self, V):
+        self.sweepNumber=0
+        self.backupNumber=0
+        self.backupTime=0
+        self.residual=None
+        self.prunedNumber=0
+        self.truncatedNumber=0
+        return ValueFunction(V['alpha'], V['action'], self.tolerance, self.dtype, self.maxAlphas)
+        
+    def limit(self, VNew, B):
+        if self.maxAlphas is None or len(VNew) <= self.maxAlphas:
+            return 0
+        removedNumber=VNew.prune(B)
+        truncatedNumber=VNew.truncate(B, self.maxAlphas)
+        self.prunedNumber+=removedNumber
+        self.truncatedNumber+=truncatedNumber
+        return removedNumber+truncatedNumber
+        
+    def admit(self, VNew, alpha, action, B):
+        if self.maxAlphas is None or len(VNew)+alpha.shape[0] <= self.maxAlphas:
+            VNew.append(alpha, action)
+            return 0
+        candidates=ValueFunction(np.concatenate([VNew['alpha'], alpha]), np.concatenate([VNew['action'], action]), 
+                                 self.tolerance, VNew.alphaBuffer.dtype, len(VNew)+alpha.shape[0])
+        removedNumber=self.limit(candidates, B)
+        VNew.replace(candidates['alpha'], candidates['action'])
+        return removedNumber
+        
+    def finish(self, VNew, B):
+        if self.pruneDominated or self.pruneUnused:
+            self.prunedNumber+=VNew.prune(B, self.pruneDominated, self.pruneUnused)
+        self.limit(VNew, B)
+        return VNew
+        
+    def backupBeliefs(self, V, B, projections=None):
+        if self.backupEngine is None:
+            alphaSet=[self.backup(V, b) for b in B]
+            return {'action':np.array([alpha['action'] for alpha in alphaSet]), 'alpha':np.array([alpha['alpha'] for alpha in alphaSet])}
+        if projections is not None:
+            return self.backupEngine(V, B, projections)
+        return self.backupEngine(V, B)
+        
+    def stageProjections(self, V):
+        if not isinstance(self.backupEngine, BatchBackup):
+            return None
+        return [self.backupEngine.projections(V, a) for a in range(self.backupEngine.actionNumber)]
         
     def __call__(self, V, B):
-        VNew=V.copy()
-        new=V.copy()
+        B=beliefArray(B)
+        VNew=self.start(V)
+        seen=set(VNew.keys)
+        if self.epsilon is not None:
+            value=np.asarray(B @ VNew['alpha'].T).max(axis=1)
         while True:
-            alphaSet=[self.backup(V, b) for b in B]
-            new=[alpha for alpha in alphaSet if alpha['alpha'] not in VNew['alpha']]
-            if new == []:
+            start=time.perf_counter()
+            alphaSet=self.backupBeliefs(V if self.epsilon is None else VNew, B)
+            self.backupTime+=time.perf_counter()-start
+            self.sweepNumber+=1
+            self.backupNumber+=B.shape[0]
+            keys=[VNew.key(alpha) for alpha in alphaSet['alpha']]
+            new=np.array([key not in seen for key in keys], dtype=bool)
+            if not new.any():
+                self.residual=0
+                break
+            seen.update(keys)
+            removedNumber=self.admit(VNew, alphaSet['alpha'][new], alphaSet['action'][new], B)
+            if self.epsilon is not None:
+                valueNew=np.maximum(value, np.asarray(B @ alphaSet['alpha'][new].T).max(axis=1))
+                self.residual=float(np.max(valueNew-value, initial=0))
+                self.prunedNumber+=VNew.prune(B, dominated=False, unused=True)
+                value=valueNew if removedNumber == 0 else np.asarray(B @ VNew['alpha'].T).max(axis=1)
+                if self.residual < self.epsilon or self.residual == 0:
+                    break
+            if self.maxSweeps is not None and self.sweepNumber >= self.maxSweeps or expired(self.deadline):
                 break
-            newAlpha=np.array([alpha['alpha'] for alpha in new])
-            newAction=np.array([alpha['action'] for alpha in new])
-            VNew['alpha']=np.vstack((VNew['alpha'], newAlpha))
-            VNew['action']=np.append(VNew['action'], newAction)
+        return self.finish(VNew, B)
+
+
+class RandomizedImprove(Improve):
+
+    def __init__(self, backup, tolerance=0, pruneDominated=False, pruneUnused=False, epsilon=None, maxSweeps=None, seed=None, 
+                 dtype=None, maxAlphas=None):
+        Improve.__init__(self, backup, tolerance, pruneDominated, pruneUnused, epsilon, maxSweeps, dtype, maxAlphas)
+        self.random=np.random.RandomState(seed)
+
+    def stage(self, V, B):
+        value=np.asarray(B @ V['alpha'].T).max(axis=1)
+        valueNew=np.full(B.shape[0], -np.inf, dtype=value.dtype)
+        notImproved=np.ones(B.shape[0], dtype=bool)
+        VNew=None
+        start=time.perf_counter()
+        projections=self.stageProjections(V)
+        self.backupTime+=time.perf_counter()-start
+        while notImproved.any():
+            i=self.random.choice(np.flatnonzero(notImproved))
+            start=time.perf_counter()
+            alphaSet=self.backupBeliefs(V, B[i:i+1], projections)
+            self.backupTime+=time.perf_counter()-start
+            self.backupNumber+=1
+            alpha, action=np.asarray(alphaSet['alpha'])[0], np.asarray(alphaSet['action'])[0]
+            alphaValue=np.asarray(B @ alpha).ravel()
+            if alphaValue[i] < value[i]:
+                best=np.argmax(np.asarray(B[i:i+1] @ V['alpha'].T))
+                alpha, action=V['alpha'][best], V['action'][best]
+                alphaValue=np.asarray(B @ alpha).ravel()
+            if VNew is None:
+                VNew=ValueFunction(alpha, action, self.tolerance, self.dtype, self.maxAlphas)
+            elif alpha not in VNew:
+                self.admit(VNew, alpha[np.newaxis], np.atleast_1d(action), B)
+            valueNew=np.maximum(valueNew, alphaValue)
+            notImproved&=valueNew < value
+            notImproved[i]=False
         return VNew
+
+    def __call__(self, V, B):
+        B=beliefArray(B)
+        if not isSparse(B):
+            B=np.atleast_2d(B)
+        VNew=self.start(V)
+        while B.shape[0] != 0:
+            VOld, VNew=VNew, self.stage(VNew, B)
+            self.limit(VNew, B)
+            self.sweepNumber+=1
+            self.residual=bellmanResidual(VOld, VNew, B)
+            if self.epsilon is None and self.maxSweeps is None or self.epsilon is not None and self.residual < self.epsilon:
+                break
+            if self.maxSweeps is not None and self.sweepNumber >= self.maxSweeps or expired(self.deadline):
+                break
+        return self.finish(VNew, B)
+
+
+
+class BatchBackup(object):
+    
+    def __init__(self, transitionMatrix, rewardMatrix=None, observationMatrix=None, gamma=None, cache=None):
+        self.model=compileModel(transitionMatrix, rewardMatrix, observationMatrix)
+        if self.model.oneStepReward is None:
+            raise ValueError('BatchBackup needs a model with a rewardMatrix')
+        self.gamma=gamma
+        self.actionNumber=self.model.actionNumber
+        self.cache=cache
+        
+    def project(self, V, a):
+        alpha=np.asarray(V['alpha'], dtype=self.model.dtype)
+        return np.matmul(alpha[np.newaxis]*self.model.observations[a][:, np.newaxis, :], self.model.transitions[a].T)
+        
+    def projections(self, V, a):
+        if self.cache is None:
+            return self.project(V, a)
+        key=('projection', cacheToken(self.model), arrayKey(V['alpha']), a)
+        gammaAO=self.cache.get(key)
+        if gammaAO is None:
+            gammaAO=self.project(V, a)
+            self.cache.put(key, gammaAO)
+        return gammaAO
+        
+    def getBetaA(self, V, B, a, gammaAO=None):
+        B=np.atleast_2d(np.asarray(B, dtype=self.model.dtype))
+        if gammaAO is None:
+            gammaAO=self.projections(V, a)
+        bestAlpha=np.argmax(np.einsum('oks,ns->nok', gammaAO, B), axis=2)
+        betaAO=gammaAO[np.arange(gammaAO.shape[0]), bestAlpha]
+        observationProbability=np.dot(B, self.model.observationTransitions[a])
+        betaAO[observationProbability==0]=0
+        betaA=self.model.oneStepReward[:, a]+self.gamma*betaAO.sum(axis=1)
+        return betaA
+        
+    def __call__(self, V, B, projections=None):
+        if not isSparse(B):
+            B=np.atleast_2d(np.asarray(beliefArray(B), dtype=modelDtype(self)))
+        if projections is None:
+            projections=[None]*self.actionNumber
+        betaA=np.array([self.getBetaA(V, B, a, projections[a]) for a in range(self.actionNumber)])
+        action=np.argmax(np.array([rowDot(B, beta) for beta in betaA]), axis=0)
+        alpha=betaA[action, np.arange(B.shape[0])]
+        return {'action':action, 'alpha':alpha}
+
+
+class SparseBatchBackup(BatchBackup):
+    
+    def __init__(self, model, gamma):
+        self.model=model
+        self.gamma=gamma
+        self.actionNumber=model.actionNumber
+        
+    def project(self, V, a):
+        transition=self.model.transitionMatrices[a]
+        return np.array([np.asarray(transition @ (self.model.observationMatrices[a][:, o].toarray()*V['alpha'].T)).T 
+                         for o in range(self.model.observationNumber)])
+        
+    def projections(self, V, a):
+        return self.project(V, a)
         
+    def getBetaA(self, V, B, a, gammaAO=None):
+        if not isSparse(B):
+            B=np.atleast_2d(B)
+        if gammaAO is None:
+            gammaAO=self.project(V, a)
+        transition=self.model.transitionMatrices[a]
+        betaAO=np.zeros((B.shape[0], self.model.stateNumber))
+        for o in range(self.model.observationNumber):
+            observationColumn=self.model.observationMatrices[a][:, o].toarray()
+            bestAlpha=np.argmax(np.asarray(B @ gammaAO[o].T), axis=1)
+            observationProbability=np.asarray(B @ (transition @ observationColumn)).ravel()
+            possible=observationProbability!=0
+            betaAO[possible]+=gammaAO[o][bestAlpha[possible]]
+        betaA=self.model.oneStepReward[:, a]+self.gamma*betaAO
+        return betaA
 
 
 class Backup(object):
@@ -63,9 +891,14 @@ class Backup(object):
     def __init__(self, getBetaA, transitionMatrix):
         self.getBetaA=getBetaA
         self.transitionMatrix=transitionMatrix
+        self.actionNumber=transitionMatrix.actionNumber if isinstance(transitionMatrix, CompiledModel) else transitionMatrix.shape[1]
+        self.backupEngine=getattr(getBetaA, 'backupEngine', None)
             
     def __call__(self, V, b):
-        betaA=np.array([self.getBetaA(V, b, a) for a in range(self.transitionMatrix.shape[1])])
+        if self.backupEngine is not None:
+            backedUp=self.backupEngine(V, b)
+            return {'action':backedUp['action'][0], 'alpha':backedUp['alpha'][0]}
+        betaA=np.array([self.getBetaA(V, b, a) for a in range(self.actionNumber)])
         a=np.argmax(np.dot(betaA, b))
         beta=betaA[a]
         return {'action':a, 'alpha':beta}
@@ -73,20 +906,24 @@ class Backup(object):
 
 class GetBetaA(object):
     
-    def __init__(self, getBetaAO, transitionMatrix, rewardMatrix, observationMatrix, gamma):
+    def __init__(self, getBetaAO, transitionMatrix, rewardMatrix=None, observationMatrix=None, gamma=None):
         self.getBetaAO=getBetaAO
-        self.transitionMatrix=transitionMatrix
-        self.rewardMatrix=rewardMatrix
-        self.observationMatrix=observationMatrix
+        self.model=compileModel(transitionMatrix, rewardMatrix, observationMatrix)
         self.gamma=gamma
+        self.backupEngine=BatchBackup(self.model, gamma=gamma) if isBatchable(getBetaAO) else None
         
     def __call__(self, V, b, a):
-        oneStepReward=(self.rewardMatrix[:, a, :]*self.transitionMatrix[:, a, :]).sum(axis=1)
-        longTermRewardForEachbPrime=np.array([self.getBetaAO(V, b, a, o) for o in range(self.observationMatrix.shape[2])])
-        longTermReward=np.dot(self.transitionMatrix[:, a, :], longTermRewardForEachbPrime.T*self.observationMatrix[:, a, :]).sum(axis=1)
-        betaA=oneStepReward+self.gamma*longTermReward
+        if self.backupEngine is not None:
+            return self.backupEngine.getBetaA(V, b, a)[0]
+        longTermRewardForEachbPrime=np.array([self.getBetaAO(V, b, a, o) for o in range(self.model.observationNumber)])
+        longTermReward=np.dot(self.model.transitions[a], longTermRewardForEachbPrime.T*self.model.observations[a].T).sum(axis=1)
+        betaA=self.model.oneStepReward[:, a]+self.gamma*longTermReward
         return betaA
 
+
+def isBatchable(getBetaAO):
+    return type(getBetaAO) is GetBetaAO and type(getBetaAO.se) is StateEstimator and getBetaAO.argmaxAlpha is argmaxAlpha
+
 class GetBetaAO(object):
     
     def __init__(self, se, argmaxAlpha):
@@ -102,29 +939,506 @@ class GetBetaAO(object):
     
 class Expand(object):
     
-    def __init__(self, se, observationMatrix, selectBelief):
+    def __init__(self, se, observationMatrix, selectBelief, beliefIndex=None, maxBeliefs=None, blockSize=256):
         self.se=se
         self.observationMatrix=observationMatrix
+        self.maxBeliefs=maxBeliefs
+        self.blockSize=blockSize
+        self.droppedNumber=0
+        self.branchShape=None
+        if observationMatrix is None:
+            observationMatrix=getattr(se, 'model', None)
+        if hasattr(observationMatrix, 'observationNumber'):
+            self.branchShape=(observationMatrix.actionNumber, observationMatrix.observationNumber)
+        elif observationMatrix is not None:
+            self.branchShape=observationMatrix.shape[1:]
         self.selectBelief=selectBelief
+        self.batchUpdate=getattr(se, 'batchUpdate', None)
+        self.beliefIndex=beliefIndex
+        self.index=None
+        self.indexedBeliefs=None
+        self.beliefUpdateNumber=0
+        self.beliefUpdateTime=0
         
-    def __call__(self, B):
-        BNew=B.copy()
-        for b in B:
-            successors=[self.se(b, a, o) for a in range(self.observationMatrix.shape[1]) for o in range(self.observationMatrix.shape[2])]
-            successors=[element for element in successors if element.sum() != 0]
-            if successors != []:
-                bNew=self.selectBelief(successors, B)
-                BNew=np.vstack((BNew, bNew))
-        return BNew
+    def __getstate__(self):
+        state=self.__dict__.copy()
+        state.update({'batchUpdate':None, 'index':None, 'indexedBeliefs':None})
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.batchUpdate=getattr(self.se, 'batchUpdate', None)
+        
+    def indexFor(self, B):
+        if self.beliefIndex is None or isSparse(B):
+            return beliefArray(B)
+        if self.indexedBeliefs is not B or len(self.index) > B.shape[0]:
+            self.index=self.beliefIndex(B)
+            self.indexedBeliefs=B
+        elif len(self.index) < B.shape[0]:
+            self.index.add(beliefArray(B)[len(self.index):])
+        return self.index
+        
+    def successorSets(self, B):
+        if self.batchUpdate is None:
+            for b in B:
+                start=time.perf_counter()
+                successors=[self.se(b, a, o) for a in range(self.branchShape[0]) for o in range(self.branchShape[1])]
+                self.beliefUpdateTime+=time.perf_counter()-start
+                self.beliefUpdateNumber+=len(successors)
+                yield np.array([element for element in successors if element.sum() != 0])
+            return
+        for updated in self.updateBlocks(B):
+            possible=updated['possible'].reshape(updated['possible'].shape[0], int(np.prod(updated['possible'].shape[1:])))
+            bPrime=updated['belief'].reshape(possible.size, updated['belief'].shape[-1])
+            densify=isSparse(bPrime) and not isSparse(B)
+            branchNumber=possible.shape[1]
+            for n in range(possible.shape[0]):
+                successors=bPrime[n*branchNumber:(n+1)*branchNumber][possible[n]]
+                yield successors.toarray() if densify else successors
+            
+    def updateBlocks(self, B):
+        branchNumber=1 if self.branchShape is None else int(np.prod(self.branchShape))
+        beliefBlock=max(1, self.blockSize//branchNumber)
+        for start in range(0, B.shape[0], beliefBlock):
+            began=time.perf_counter()
+            updated=self.batchUpdate(B[start:start+beliefBlock])
+            self.beliefUpdateTime+=time.perf_counter()-began
+            self.beliefUpdateNumber+=updated['possible'].size
+            yield updated
+        
+    def select(self, beliefs, reference):
+        return [self.selectBelief(successors, reference) for successors in self.successorSets(beliefs) if successors.shape[0] != 0]
+        
+    def __call__(self, B, start=0):
+        self.beliefUpdateNumber=0
+        self.beliefUpdateTime=0
+        newBeliefs=self.select(beliefArray(B)[start:], self.indexFor(B))
+        newBeliefs, self.droppedNumber=capBeliefs(B, newBeliefs, self.maxBeliefs)
+        return stackBeliefs(B, newBeliefs)
+
+
+def capBeliefs(B, newBeliefs, maxBeliefs):
+    if maxBeliefs is None:
+        return newBeliefs, 0
+    room=max(maxBeliefs-B.shape[0], 0)
+    return newBeliefs[:room], max(len(newBeliefs)-room, 0)
+
+
+def stackBeliefs(B, newBeliefs):
+    if isSparse(B):
+        return sp.vstack([B]+newBeliefs, format='csr')
+    if isinstance(B, BeliefSet):
+        if newBeliefs != []:
+            B.append(np.array(newBeliefs))
+        return B
+    return np.vstack([B]+newBeliefs)
+
+
+def l1Distance(B, b):
+    if not isSparse(B):
+        return abs(B-b).sum(axis=1)
+    b=sp.csr_matrix(b)
+    overlap=np.minimum(B[:, b.indices].toarray(), b.data).sum(axis=1)
+    return np.asarray(B.sum(axis=1)).ravel()+b.sum()-2*overlap
+
+
+def l1DistanceBlocks(X, B, blockSize=256, blockElements=2**21):
+    stateNumber=max(X.shape[1], 1)
+    beliefBlock=max(1, min(blockSize, blockElements//stateNumber))
+    rowBlock=max(1, blockElements//(beliefBlock*stateNumber))
+    for row in range(0, X.shape[0], rowBlock):
+        rows=X[row:row+rowBlock]
+        for start in range(0, B.shape[0], beliefBlock):
+            yield row, start, abs(rows[:, np.newaxis, :]-B[np.newaxis, start:start+beliefBlock, :]).sum(axis=2)
+
+
+def minL1Distance(X, B, blockSize=256, blockElements=2**21):
+    distance=np.full(X.shape[0], np.inf)
+    for row, start, blockDistance in l1DistanceBlocks(X, B, blockSize, blockElements):
+        rows=slice(row, row+blockDistance.shape[0])
+        distance[rows]=np.minimum(distance[rows], blockDistance.min(axis=1))
+    return distance
+
+
+class BruteForceIndex(object):
+    
+    def __init__(self, B, blockSize=256):
+        self.beliefs=BeliefSet(beliefArray(B))
+        self.blockSize=blockSize
+        
+    def __len__(self):
+        return len(self.beliefs)
+    
+    def add(self, B):
+        self.beliefs.append(B)
+        
+    def query(self, X):
+        return minL1Distance(np.atleast_2d(X), self.beliefs.view(), self.blockSize)
+    
+    
+class KDTreeIndex(BruteForceIndex):
+    
+    def __init__(self, B, blockSize=256, rebuildRatio=0.25):
+        BruteForceIndex.__init__(self, B, blockSize)
+        self.rebuildRatio=rebuildRatio
+        self.rebuild()
+        
+    def rebuild(self):
+        self.tree=cKDTree(self.beliefs.view())
+        self.treeSize=len(self.beliefs)
+        
+    def add(self, B):
+        self.beliefs.append(B)
+        if len(self.beliefs)-self.treeSize > self.rebuildRatio*self.treeSize:
+            self.rebuild()
+            
+    def query(self, X):
+        X=np.atleast_2d(X)
+        distance=self.tree.query(X, p=1)[0]
+        pending=self.beliefs.view()[self.treeSize:]
+        if pending.shape[0] != 0:
+            distance=np.minimum(distance, minL1Distance(X, pending, self.blockSize))
+        return distance
+
 
 def furthestB(successors, B):
-    L1Distance=-np.Inf
-    for bNew in successors:
-        distance=min(abs(B-bNew).sum(axis=1))
-        if distance > L1Distance:
-            bFurthest=bNew
-            L1Distance=distance
-    return bFurthest              
+    if isSparse(B):
+        L1Distance=-np.inf
+        for bNew in successors:
+            distance=min(l1Distance(B, bNew))
+            if distance > L1Distance:
+                bFurthest=bNew
+                L1Distance=distance
+        return bFurthest
+    successors=np.atleast_2d(successors)
+    if isinstance(B, BruteForceIndex):
+        distance=B.query(successors)
+    else:
+        distance=minL1Distance(successors, beliefArray(B))
+    return successors[np.argmax(distance)]
+
+
+def nearestL1(X, B, blockSize=256, blockElements=2**21):
+    distance=np.full(X.shape[0], np.inf)
+    index=np.zeros(X.shape[0], dtype=int)
+    for row, start, blockDistance in l1DistanceBlocks(X, B, blockSize, blockElements):
+        rows=np.arange(row, row+blockDistance.shape[0])
+        blockIndex=np.argmin(blockDistance, axis=1)
+        blockDistance=blockDistance[np.arange(rows.size), blockIndex]
+        closer=blockDistance < distance[rows]
+        distance[rows[closer]]=blockDistance[closer]
+        index[rows[closer]]=blockIndex[closer]+start
+    return distance, index
+
+
+def furthestFirst(X, distance, number):
+    distance=np.array(distance, dtype=float)
+    chosen=[]
+    while len(chosen) < number and distance.size != 0:
+        n=np.argmax(distance)
+        if distance[n] <= 0:
+            break
+        chosen.append(n)
+        distance=np.minimum(distance, l1Distance(X, X[n]))
+    return X[chosen]
+
+
+class BatchExpand(Expand):
+    
+    def __init__(self, se, maxNewBeliefs=None, beliefIndex=None, maxBeliefs=None, blockSize=256):
+        Expand.__init__(self, se, se.model, None, beliefIndex, maxBeliefs, blockSize)
+        self.model=se.model
+        self.maxNewBeliefs=maxNewBeliefs
+        
+    def newNumber(self, B):
+        return B.shape[0] if self.maxNewBeliefs is None else self.maxNewBeliefs
+        
+    def distance(self, X, reference):
+        if isinstance(reference, BruteForceIndex):
+            return reference.query(X)
+        return minL1Distance(X, reference)
+        
+    def __call__(self, B, start=0):
+        if isSparse(B):
+            raise ValueError('%s needs dense beliefs' % type(self).__name__)
+        self.beliefUpdateNumber=0
+        self.beliefUpdateTime=0
+        beliefs=beliefArray(B)[start:]
+        newBeliefs=list(self.choose(beliefs, self.indexFor(B), beliefArray(B))) if beliefs.shape[0] != 0 else []
+        newBeliefs, self.droppedNumber=capBeliefs(B, newBeliefs, self.maxBeliefs)
+        return stackBeliefs(B, newBeliefs)
+
+
+class StochasticExpand(BatchExpand):
+    
+    def __init__(self, se, maxNewBeliefs=None, seed=None, policy=None, beliefIndex=None, maxBeliefs=None, blockSize=256):
+        BatchExpand.__init__(self, se, maxNewBeliefs, beliefIndex, maxBeliefs, blockSize)
+        self.random=np.random.RandomState(seed)
+        self.policy=policy
+        
+    def choose(self, beliefs, reference, B):
+        if self.policy is None:
+            actions=self.random.randint(self.model.actionNumber, size=beliefs.shape[0])
+        else:
+            actions=np.asarray(self.policy(beliefs))
+        successors=np.zeros(beliefs.shape, dtype=self.model.dtype)
+        began=time.perf_counter()
+        for a in np.unique(actions):
+            chosen=np.flatnonzero(actions == a)
+            observationProbability=np.cumsum(beliefs[chosen] @ self.model.observationTransitions[a], axis=1)
+            threshold=self.random.random_sample(chosen.size)*observationProbability[:, -1]
+            observations=np.minimum((observationProbability <= threshold[:, np.newaxis]).sum(axis=1), self.model.observationNumber-1)
+            correction=(beliefs[chosen] @ self.model.transitions[a])*self.model.observations[a, observations]
+            normalizer=correction.sum(axis=1)
+            possible=normalizer != 0
+            successors[chosen[possible]]=correction[possible]/normalizer[possible, np.newaxis]
+        self.beliefUpdateTime+=time.perf_counter()-began
+        self.beliefUpdateNumber+=beliefs.shape[0]
+        successors=successors[successors.sum(axis=1) != 0]
+        return furthestFirst(successors, self.distance(successors, reference), self.newNumber(beliefs))
+
+
+class TopKExpand(BatchExpand):
+    
+    def choose(self, beliefs, reference, B):
+        number=self.newNumber(beliefs)
+        candidates=[]
+        for updated in self.updateBlocks(beliefs):
+            successors=updated['belief'][updated['possible']]
+            candidates.append(furthestFirst(successors, self.distance(successors, reference), number))
+        candidates=np.concatenate(candidates)
+        return furthestFirst(candidates, self.distance(candidates, reference), number)
+
+
+class GreedyErrorExpand(BatchExpand):
+    
+    def __init__(self, se, gamma, maxNewBeliefs=None, model=None, beliefIndex=None, maxBeliefs=None, blockSize=256):
+        BatchExpand.__init__(self, se, maxNewBeliefs, beliefIndex, maxBeliefs, blockSize)
+        rewardModel=self.model if model is None else model
+        if rewardModel.oneStepReward is None:
+            raise ValueError('GreedyErrorExpand needs a model with a rewardMatrix')
+        self.upper=rewardModel.oneStepReward.max()/(1-gamma)
+        self.lower=rewardModel.oneStepReward.min()/(1-gamma)
+        self.V=None
+        
+    def errorBound(self, successors, B, alpha):
+        distance, nearest=nearestL1(successors, B, self.blockSize)
+        alphaNearest=alpha[np.argmax(B[nearest] @ alpha.T, axis=1)]
+        difference=successors-B[nearest]
+        return (np.where(difference >= 0, self.upper-alphaNearest, self.lower-alphaNearest)*difference).sum(axis=1)
+        
+    def choose(self, beliefs, reference, B):
+        alpha=np.full((1, B.shape[1]), self.lower) if self.V is None else np.asarray(self.V['alpha'])
+        candidates, scores=[], []
+        for updated in self.updateBlocks(beliefs):
+            successors=updated['belief']
+            n, actionNumber, observationNumber=updated['possible'].shape
+            error=self.errorBound(successors.reshape(-1, B.shape[1]), B, alpha).reshape(n, actionNumber, observationNumber)
+            weighted=np.where(updated['possible'], updated['probability']*error, 0)
+            action=np.argmax(weighted.sum(axis=2), axis=1)
+            observation=np.argmax(weighted[np.arange(n), action], axis=1)
+            candidates.append(successors[np.arange(n), action, observation])
+            scores.append(weighted.sum(axis=2)[np.arange(n), action])
+        candidates, scores=np.concatenate(candidates), np.concatenate(scores)
+        chosen, keys=[], set()
+        for n in np.argsort(-scores, kind='stable'):
+            key=arrayKey(candidates[n], 1e-9)
+            if scores[n] <= 0 or len(chosen) == self.newNumber(beliefs):
+                break
+            if key not in keys:
+                keys.add(key)
+                chosen.append(n)
+        return candidates[chosen]
+
+
+class SharedArray(object):
+    
+    def __init__(self, array):
+        array=np.ascontiguousarray(array)
+        self.shape=array.shape
+        self.dtype=array.dtype
+        self.block=shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.name=self.block.name
+        np.ndarray(self.shape, self.dtype, buffer=self.block.buf)[...]=array
+        
+    def __getstate__(self):
+        return {'name':self.name, 'shape':self.shape, 'dtype':self.dtype}
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.block=None
+        
+    def attach(self):
+        if self.block is None:
+            self.block=shared_memory.SharedMemory(name=self.name)
+        return np.ndarray(self.shape, self.dtype, buffer=self.block.buf)
+    
+    def close(self):
+        self.block.close()
+        self.block=None
+    
+    def unlink(self):
+        self.block.close()
+        self.block.unlink()
+        
+        
+class SharedObject(object):
+    
+    def __init__(self, obj):
+        self.cls=type(obj)
+        state=obj.__getstate__() if hasattr(obj, '__getstate__') else vars(obj)
+        self.state={key: shareValue(value) for key, value in state.items()}
+        
+    def attach(self):
+        obj=self.cls.__new__(self.cls)
+        state={key: value.attach() if isinstance(value, (SharedArray, SharedObject)) else value for key, value in self.state.items()}
+        if hasattr(obj, '__setstate__'):
+            obj.__setstate__(state)
+        else:
+            obj.__dict__.update(state)
+        return obj
+    
+    def unlink(self):
+        for value in self.state.values():
+            if isinstance(value, (SharedArray, SharedObject)):
+                value.unlink()
+
+
+def shareValue(value):
+    if isinstance(value, np.ndarray):
+        return SharedArray(value)
+    if type(value).__module__ == __name__ and hasattr(value, '__dict__'):
+        return SharedObject(value)
+    return value
+
+
+workerObjects={}
+
+
+def initializeWorker(sharedObjects):
+    workerObjects.update({name: sharedObject.attach() for name, sharedObject in sharedObjects.items()})
+    
+
+def runShared(name, function, arguments):
+    sharedArrays=[argument for argument in arguments if isinstance(argument, SharedArray)]
+    arguments=[argument.attach() if isinstance(argument, SharedArray) else argument for argument in arguments]
+    result=function(workerObjects[name], *arguments)
+    del arguments
+    for sharedArray in sharedArrays:
+        sharedArray.close()
+    return result
+
+
+class WorkerPool(object):
+    
+    def __init__(self, workerNumber=None, mode='thread'):
+        if mode not in ('thread', 'process'):
+            raise ValueError("mode must be 'thread' or 'process', got %r" % (mode,))
+        self.workerNumber=workerNumber or os.cpu_count()
+        self.mode=mode
+        self.objects={}
+        self.sharedObjects={}
+        self.executor=None
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exception):
+        self.close()
+        
+    def share(self, obj):
+        for name, shared in self.objects.items():
+            if shared is obj:
+                return name
+        name=str(len(self.objects))
+        self.objects[name]=obj
+        if self.mode == 'process':
+            self.sharedObjects[name]=SharedObject(obj)
+            self.shutdown()
+        return name
+    
+    def start(self):
+        if self.executor is not None:
+            return
+        if self.mode == 'thread':
+            self.executor=ThreadPoolExecutor(self.workerNumber)
+        else:
+            self.executor=ProcessPoolExecutor(self.workerNumber, initializer=initializeWorker, initargs=(self.sharedObjects,))
+            
+    def shards(self, size):
+        bounds=np.linspace(0, size, min(self.workerNumber, max(size, 1))+1).astype(int)
+        return list(zip(bounds[:-1], bounds[1:]))
+    
+    def map(self, name, function, arrays, tasks):
+        self.start()
+        if self.mode == 'thread':
+            obj=self.objects[name]
+            return list(self.executor.map(lambda task: function(obj, *(list(arrays)+list(task))), tasks))
+        arrays=[SharedArray(array) if isinstance(array, np.ndarray) else array for array in arrays]
+        try:
+            futures=[self.executor.submit(runShared, name, function, arrays+list(task)) for task in tasks]
+            return [future.result() for future in futures]
+        finally:
+            for array in arrays:
+                if isinstance(array, SharedArray):
+                    array.unlink()
+                    
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor=None
+        
+    def close(self):
+        self.shutdown()
+        for sharedObject in self.sharedObjects.values():
+            sharedObject.unlink()
+        self.sharedObjects={}
+
+
+def backupShard(backupEngine, alpha, B, start, stop):
+    return backupEngine({'alpha':alpha}, B[start:stop])
+
+
+def expandShard(expand, beliefs, reference, start, stop):
+    if reference is None:
+        reference=beliefs
+    return expand.select(beliefs[start:stop], reference)
+
+
+class ParallelBackup(object):
+    
+    def __init__(self, engine, pool):
+        self.engine=engine
+        self.pool=pool
+        self.name=pool.share(engine)
+        
+    def __call__(self, V, B):
+        if not isSparse(B):
+            B=np.atleast_2d(beliefArray(B))
+        backedUp=self.pool.map(self.name, backupShard, [V['alpha'], B], self.pool.shards(B.shape[0]))
+        return {'action':np.concatenate([shard['action'] for shard in backedUp]), 
+                'alpha':np.concatenate([shard['alpha'] for shard in backedUp])}
+    
+
+class ParallelExpand(object):
+    
+    def __init__(self, expand, pool):
+        self.expand=expand
+        self.pool=pool
+        if isinstance(expand, BatchExpand):
+            raise TypeError('%s is already vectorized and cannot be sharded; call it directly' % type(expand).__name__)
+        self.name=pool.share(expand)
+        self.maxBeliefs=getattr(expand, 'maxBeliefs', None)
+        self.droppedNumber=0
+        
+    def __call__(self, B, start=0):
+        beliefs=beliefArray(B)
+        reference=self.expand.indexFor(B) if self.pool.mode == 'thread' else None
+        shards=[(first+start, last+start) for first, last in self.pool.shards(beliefs.shape[0]-start)]
+        selected=self.pool.map(self.name, expandShard, [beliefs, reference], shards)
+        newBeliefs, self.droppedNumber=capBeliefs(B, [bNew for shard in selected for bNew in shard], self.maxBeliefs)
+        return stackBeliefs(B, newBeliefs)
 
 
 def argmaxAlpha(V, b):
@@ -145,6 +1459,36 @@ def evaluateAction(V, b, a):
     return Q
 
 
+class CompiledPolicy(object):
+    
+    def __init__(self, V, dtype=np.float64):
+        self.action=np.asarray(V['action'])
+        self.alpha=np.asarray(V['alpha'])
+        if (np.diff(self.action) < 0).any():
+            order=np.argsort(self.action, kind='stable')
+            self.action=self.action[order]
+            self.alpha=self.alpha[order]
+        self.alpha=np.ascontiguousarray(self.alpha, dtype=dtype)
+        self.actions, self.groupStart=np.unique(self.action, return_index=True)
+        
+    def values(self, B):
+        return np.dot(np.asarray(B, dtype=self.alpha.dtype), self.alpha.T)
+    
+    def __call__(self, B):
+        return self.action[np.argmax(self.values(B), axis=-1)]
+    
+    def value(self, B):
+        return self.values(B).max(axis=-1)
+    
+    def qValues(self, B):
+        return np.maximum.reduceat(self.values(B), self.groupStart, axis=-1)
+    
+    def evaluate(self, B):
+        values=self.values(B)
+        return {'action':self.action[np.argmax(values, axis=-1)], 'value':values.max(axis=-1), 
+                'q':np.maximum.reduceat(values, self.groupStart, axis=-1)}
+
+
     
 
 def main():
@@ -156,22 +1500,27 @@ def main():
     observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
                                 [[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]]])
     
-    beliefTransition=StateEstimator(transitionMatrix, observationMatrix)
+    model=CompiledModel(transitionMatrix, rewardMatrix, observationMatrix)
+    beliefTransition=StateEstimator(model)
     getBetaAO=GetBetaAO(beliefTransition, argmaxAlpha)
     
     gamma=0.5
-    getBetaA=GetBetaA(getBetaAO, transitionMatrix, rewardMatrix, observationMatrix, gamma)
-    backup=Backup(getBetaA, transitionMatrix)    
-    improve=Improve(backup)
+    getBetaA=GetBetaA(getBetaAO, model, gamma=gamma)
+    backup=Backup(getBetaA, model)    
+    improve=Improve(backup, pruneDominated=True, pruneUnused=True)
     
-    expand=Expand(beliefTransition, observationMatrix, furthestB)
+    expand=Expand(beliefTransition, model, furthestB)
     
     expansionNumber=3
     V={'action': 2, 'alpha': np.array([[rewardMatrix.min()/(1-gamma) for s in range(transitionMatrix.shape[0])]])}
     pbvi=PBVI(improve, expand, getPolicy, V, expansionNumber)
     
     B=np.array([[0.05*n, 1-0.05*n] for n in range(21)])
-    a=[pbvi(b) for b in B]
+    a=[]
+    state=None
+    for b in B:
+        a.append(pbvi(np.atleast_2d(b), state))
+        state=pbvi.state
     print(a)
     
 
@@ -0,0 +1,85 @@
+
+
+import time
+from statistics import NormalDist
+import numpy as np
+import pomdpNumpy
+
+
+def sampleRows(random, probability):
+    threshold=random.random(probability.shape[0])[:, np.newaxis]
+    return np.minimum((np.cumsum(probability, axis=1) < threshold).sum(axis=1), probability.shape[1]-1)
+
+
+def simulateShard(simulator, initialBelief, policy, episodeNumber, horizon, seed):
+    start=time.thread_time()
+    returns=simulator.simulate(policy, initialBelief, episodeNumber, horizon, seed)
+    return {'returns':returns, 'cpuSeconds':time.thread_time()-start}
+
+
+class Simulator(object):
+
+    def __init__(self, transitionMatrix, rewardMatrix=None, observationMatrix=None, gamma=0.95):
+        self.model=pomdpNumpy.compileModel(transitionMatrix, rewardMatrix, observationMatrix)
+        if self.model.rewardMatrix is None:
+            raise ValueError('Simulator needs a model with a rewardMatrix')
+        self.gamma=gamma
+        self.se=pomdpNumpy.StateEstimator(self.model)
+
+    def updateBeliefs(self, B, actions, observations):
+        updated=self.se.groupedUpdate(B, actions, observations)
+        return np.where(updated['possible'][:, np.newaxis], updated['belief'], updated['predicted'])
+
+    def simulate(self, policy, initialBelief, episodeNumber, horizon, seed=0):
+        random=np.random.default_rng(seed)
+        policy=policy if callable(policy) else pomdpNumpy.CompiledPolicy(policy)
+        rewardMatrix=self.model.rewardMatrix
+        states=random.choice(self.model.stateNumber, episodeNumber, p=initialBelief)
+        B=np.tile(np.asarray(initialBelief, dtype=self.model.transitions.dtype), (episodeNumber, 1))
+        returns=np.zeros(episodeNumber)
+        discount=1
+        for t in range(horizon):
+            actions=np.asarray(policy(B))
+            nextStates=sampleRows(random, self.model.transitionMatrix[states, actions])
+            if rewardMatrix.ndim == 3:
+                returns+=discount*rewardMatrix[states, actions, nextStates]
+            else:
+                returns+=discount*rewardMatrix[states, actions]
+            observations=sampleRows(random, self.model.observationMatrix[nextStates, actions])
+            B=self.updateBeliefs(B, actions, observations)
+            states=nextStates
+            discount*=self.gamma
+        return returns
+
+    def evaluate(self, policy, initialBelief, episodeNumber=1000, horizon=100, seed=0, confidence=0.95, pool=None,
+                 blockSize=1024):
+        initialBelief=np.asarray(initialBelief, dtype=float)
+        blocks=[min(blockSize, episodeNumber-start) for start in range(0, episodeNumber, blockSize)]
+        seeds=np.random.SeedSequence(seed).spawn(len(blocks))
+        tasks=[(policy, count, horizon, blockSeed) for count, blockSeed in zip(blocks, seeds)]
+        start=time.perf_counter()
+        if pool is None:
+            shards=[simulateShard(self, initialBelief, *task) for task in tasks]
+        else:
+            shards=pool.map(pool.share(self), simulateShard, [initialBelief], tasks)
+        seconds=time.perf_counter()-start
+        returns=np.concatenate([shard['returns'] for shard in shards])
+        standardError=returns.std(ddof=1)/np.sqrt(returns.size) if returns.size > 1 else float('inf')
+        halfWidth=NormalDist().inv_cdf((1+confidence)/2)*standardError
+        return {'mean':float(returns.mean()), 'standardError':float(standardError),
+                'confidenceInterval':(float(returns.mean()-halfWidth), float(returns.mean()+halfWidth)),
+                'confidence':confidence, 'episodeNumber':episodeNumber, 'horizon':horizon, 'seconds':seconds,
+                'cpuSeconds':sum(shard['cpuSeconds'] for shard in shards), 'returns':returns}
+
+
+def compareSolvers(simulator, solvers, B, initialBelief, episodeNumber=1000, horizon=100, seed=0, pool=None):
+    results=[]
+    for name, solve in solvers.items():
+        start=time.process_time()
+        V=solve(B)
+        solveCpuSeconds=time.process_time()-start
+        evaluation=simulator.evaluate(V, initialBelief, episodeNumber, horizon, seed, pool=pool)
+        results.append({'solver':name, 'solveCpuSeconds':solveCpuSeconds, 'alphaNumber':len(V['alpha']), 
+                        'mean':evaluation['mean'], 'confidenceInterval':evaluation['confidenceInterval'],
+                        'evaluationCpuSeconds':evaluation['cpuSeconds']})
+    return results
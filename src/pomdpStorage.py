@@ -0,0 +1,70 @@
+
+
+import json
+import os
+import numpy as np
+import pomdpNumpy
+
+
+formatName='pomdpNumpy'
+formatVersion=1
+headerName='header.json'
+
+
+def saveArrays(path, kind, arrays):
+    os.makedirs(path, exist_ok=True)
+    header={'format': formatName, 'version': formatVersion, 'kind': kind, 'arrays': {}}
+    for name, array in arrays.items():
+        array=np.ascontiguousarray(array)
+        fileName=name+'.npy'
+        np.save(os.path.join(path, fileName), array)
+        header['arrays'][name]={'file': fileName, 'shape': list(array.shape), 'dtype': array.dtype.str}
+    with open(os.path.join(path, headerName), 'w') as f:
+        json.dump(header, f, indent=2)
+
+
+def loadArrays(path, kind, mmapMode='r'):
+    with open(os.path.join(path, headerName)) as f:
+        header=json.load(f)
+    if header.get('format') != formatName or header.get('version') != formatVersion:
+        raise ValueError('%s is not a %s version %d file set' % (path, formatName, formatVersion))
+    if header['kind'] != kind:
+        raise ValueError('%s holds a %s, not a %s' % (path, header['kind'], kind))
+    arrays={}
+    for name, entry in header['arrays'].items():
+        array=np.load(os.path.join(path, entry['file']), mmap_mode=mmapMode)
+        if list(array.shape) != entry['shape'] or array.dtype.str != entry['dtype']:
+            raise ValueError('%s in %s does not match its header' % (entry['file'], path))
+        arrays[name]=array
+    return arrays
+
+
+def saveModel(path, *, transitionMatrix, rewardMatrix, observationMatrix):
+    stateNumber, actionNumber, observationNumber=observationMatrix.shape
+    if transitionMatrix.shape != (stateNumber, actionNumber, stateNumber):
+        raise ValueError('model matrices have inconsistent shapes')
+    if rewardMatrix.shape not in (transitionMatrix.shape, transitionMatrix.shape[:2]):
+        raise ValueError('rewardMatrix must have shape (S, A, S) or (S, A), got %s' % (rewardMatrix.shape,))
+    saveArrays(path, 'model', {'transitionMatrix': transitionMatrix, 'observationMatrix': observationMatrix,
+                               'rewardMatrix': rewardMatrix})
+
+
+def loadModel(path, mmapMode='r'):
+    return loadArrays(path, 'model', mmapMode)
+
+
+def saveBeliefs(path, B):
+    saveArrays(path, 'beliefs', {'B': pomdpNumpy.beliefArray(B)})
+
+
+def loadBeliefs(path, mmapMode='r'):
+    return loadArrays(path, 'beliefs', mmapMode)['B']
+
+
+def saveValueFunction(path, V):
+    order=np.argsort(V['action'], kind='stable')
+    saveArrays(path, 'valueFunction', {'alpha': np.asarray(V['alpha'])[order], 'action': np.asarray(V['action'])[order]})
+
+
+def loadValueFunction(path, mmapMode='r'):
+    return loadArrays(path, 'valueFunction', mmapMode)
@@ -0,0 +1,132 @@
+
+
+import asyncio
+import numpy as np
+import pomdpNumpy
+
+
+class BeliefTracker(object):
+
+    recoveries=('reset', 'predict', 'keep', 'raise')
+
+    def __init__(self, transitionMatrix, observationMatrix, policy, initialBelief, capacity=1024, recovery='reset'):
+        if recovery not in self.recoveries:
+            raise ValueError('recovery must be one of %s' % (self.recoveries,))
+        self.model=pomdpNumpy.compileModel(transitionMatrix, None, observationMatrix)
+        self.se=pomdpNumpy.StateEstimator(self.model)
+        self.policy=policy
+        self.initialBelief=np.asarray(initialBelief, dtype=self.model.transitions.dtype)
+        self.recovery=recovery
+        self.buffer=np.empty((max(capacity, 1), self.model.stateNumber), dtype=self.initialBelief.dtype)
+        self.slots={}
+        self.freeSlots=list(range(self.buffer.shape[0]-1, -1, -1))
+        self.impossibleNumber=0
+        self.updateNumber=0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, sessionId):
+        return sessionId in self.slots
+
+    def addSession(self, sessionId, belief=None):
+        if sessionId in self.slots:
+            raise KeyError('session %r is already tracked' % (sessionId,))
+        if len(self.freeSlots) == 0:
+            size=self.buffer.shape[0]
+            self.buffer=pomdpNumpy.reserve(self.buffer, size+1)
+            self.freeSlots=list(range(self.buffer.shape[0]-1, size-1, -1))
+        slot=self.freeSlots.pop()
+        self.buffer[slot]=self.initialBelief if belief is None else belief
+        self.slots[sessionId]=slot
+        return slot
+
+    def removeSession(self, sessionId):
+        self.freeSlots.append(self.slots.pop(sessionId))
+
+    def belief(self, sessionId):
+        return self.buffer[self.slots[sessionId]].copy()
+
+    def decide(self, sessionIds):
+        slots=[self.slots[sessionId] for sessionId in sessionIds]
+        return dict(zip(sessionIds, np.asarray(self.policy(self.buffer[slots])).tolist()))
+
+    def rounds(self, events):
+        seen={}
+        rounds=[]
+        for sessionId, a, o in events:
+            k=seen.get(sessionId, 0)
+            seen[sessionId]=k+1
+            if k == len(rounds):
+                rounds.append([])
+            rounds[k].append((self.slots[sessionId], a, o))
+        return rounds, list(seen)
+
+    def updateRound(self, slots, actions, observations):
+        updated=self.se.groupedUpdate(self.buffer[slots], actions, observations)
+        corrected=updated['belief']
+        impossible=~updated['possible']
+        if impossible.any():
+            self.impossibleNumber+=int(impossible.sum())
+            if self.recovery == 'raise':
+                raise ValueError('observations %s are impossible after actions %s' % (observations[impossible].tolist(), 
+                                                                                       actions[impossible].tolist()))
+            if self.recovery == 'reset':
+                corrected[impossible]=self.initialBelief
+            elif self.recovery == 'predict':
+                corrected[impossible]=updated['predicted'][impossible]
+            else:
+                corrected[impossible]=self.buffer[slots[impossible]]
+        self.buffer[slots]=corrected
+
+    def update(self, events):
+        rounds, sessionIds=self.rounds(events)
+        if self.recovery == 'raise':
+            touched=[self.slots[sessionId] for sessionId in sessionIds]
+            saved=(self.buffer[touched].copy(), self.updateNumber)
+        try:
+            for batch in rounds:
+                self.updateRound(*(np.array(column) for column in zip(*batch)))
+                self.updateNumber+=len(batch)
+        except ValueError:
+            if self.recovery == 'raise':
+                self.buffer[touched], self.updateNumber=saved
+            raise
+        if len(sessionIds) == 0:
+            return {}
+        return self.decide(sessionIds)
+
+    async def stream(self, events, maxBatch=256, maxDelay=0.001):
+        loop=asyncio.get_running_loop()
+        queue=asyncio.Queue()
+        finished=object()
+
+        async def produce():
+            try:
+                async for event in events:
+                    await queue.put(event)
+            finally:
+                await queue.put(finished)
+
+        producer=asyncio.ensure_future(produce())
+        try:
+            done=False
+            while not done:
+                batch=[await queue.get()]
+                deadline=loop.time()+maxDelay
+                while len(batch) < maxBatch and batch[-1] is not finished:
+                    timeout=deadline-loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                if batch[-1] is finished:
+                    done=True
+                    batch.pop()
+                for decision in self.update(batch).items():
+                    yield decision
+            await producer
+        finally:
+            producer.cancel()
@@ -0,0 +1,59 @@
+
+
+import sys
+sys.path.append('../src/')
+import json
+import os
+import tempfile
+
+import unittest
+from ddt import ddt, data, unpack
+import pomdpDomains
+import benchmarkPomdp as targetCode
+
+@ddt
+class TestBenchmark(unittest.TestCase):
+    
+    @data((pomdpDomains.tiger(), 8, ['StateEstimator', 'StateEstimator.batchUpdate', 'BatchBackup', 'Improve', 'Expand', 'PBVI']))
+    @unpack
+    def testBenchmarkDenseModel(self, model, beliefNumber, expectedCases):
+        results=targetCode.benchmarkDenseModel('tiger', model, beliefNumber, 1, repeat=1)
+        self.assertEqual([result['case'] for result in results], expectedCases)
+        for result in results:
+            self.assertEqual(result['beliefNumber'], beliefNumber)
+            self.assertGreater(result['throughput'], 0)
+            self.assertGreaterEqual(result['peakMemory'], 0)
+            
+    @data((pomdpDomains.randomSparseModel(200, 2, 3, 3), 8, ['SparseStateEstimator.batchUpdate', 'SparseBatchBackup']))
+    @unpack
+    def testBenchmarkSparseModel(self, model, beliefNumber, expectedCases):
+        results=targetCode.benchmarkSparseModel('sparse', model, beliefNumber, repeat=1)
+        self.assertEqual([result['case'] for result in results], expectedCases)
+        
+    def testMeasureTimesWithoutTracing(self):
+        tracing=[]
+        measured=targetCode.measure(lambda: tracing.append(targetCode.tracemalloc.is_tracing()), repeat=2)
+        self.assertEqual(tracing, [False, False, True])
+        self.assertFalse(targetCode.tracemalloc.is_tracing())
+        self.assertGreaterEqual(measured['peakMemory'], 0)
+        
+    def testMainWritesJSON(self):
+        targetCode.scales['test']={'beliefNumber': 4, 'domains': ['tiger'], 'randomStates': [5], 'sparseStates': [50], 'expansionNumber': 1}
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                path=os.path.join(directory, 'results.json')
+                targetCode.main(['--scale', 'test', '--repeat', '1', '--output', path])
+                with open(path) as f:
+                    report=json.load(f)
+        finally:
+            del targetCode.scales['test']
+        self.assertEqual(report['scale'], 'test')
+        self.assertIn('numpy', report['environment'])
+        self.assertTrue(report['results'])
+               
+    def tearDown(self):
+        pass
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -0,0 +1,63 @@
+
+
+import sys
+sys.path.append('../src/')
+import numpy as np
+
+import unittest
+from numpy.testing import assert_almost_equal
+from ddt import ddt, data, unpack
+import pomdpDomains as targetCode
+
+@ddt
+class TestDomains(unittest.TestCase):
+    
+    @data((targetCode.tiger, (), (2, 3, 3)),
+          (targetCode.rockSample, (4, 4), (257, 9, 3)),
+          (targetCode.hallway, (), (68, 5, 17)),
+          (targetCode.tag, (), (842, 5, 30)),
+          (targetCode.randomPOMDP, (20, 3, 4), (20, 3, 4)),
+          (targetCode.randomPOMDP, (20, 3, 4, 3, 2), (20, 3, 4)))
+    @unpack
+    def testStochasticMatrices(self, domain, arguments, expectedShape):
+        model=domain(*arguments)
+        stateNumber, actionNumber, observationNumber=expectedShape
+        self.assertEqual(model['transitionMatrix'].shape, (stateNumber, actionNumber, stateNumber))
+        self.assertEqual(model['rewardMatrix'].shape, (stateNumber, actionNumber, stateNumber))
+        self.assertEqual(model['observationMatrix'].shape, expectedShape)
+        assert_almost_equal(model['transitionMatrix'].sum(axis=2), np.ones((stateNumber, actionNumber)))
+        assert_almost_equal(model['observationMatrix'].sum(axis=2), np.ones((stateNumber, actionNumber)))
+        self.assertTrue((model['transitionMatrix'] >= 0).all())
+        
+    @data((20, 3, 4, 3, 2))
+    @unpack
+    def testRandomPOMDPSupport(self, stateNumber, actionNumber, observationNumber, successorNumber, observationSupport):
+        model=targetCode.randomPOMDP(stateNumber, actionNumber, observationNumber, successorNumber, observationSupport)
+        self.assertTrue(((model['transitionMatrix'] > 0).sum(axis=2) == successorNumber).all())
+        self.assertTrue(((model['observationMatrix'] > 0).sum(axis=2) == observationSupport).all())
+        
+    @data((targetCode.randomPOMDP, (20, 3, 4)), (targetCode.rockSample, (4, 2)))
+    @unpack
+    def testSeeded(self, domain, arguments):
+        first, second, other=domain(*arguments, seed=1), domain(*arguments, seed=1), domain(*arguments, seed=2)
+        assert_almost_equal(first['transitionMatrix'], second['transitionMatrix'])
+        assert_almost_equal(first['observationMatrix'], second['observationMatrix'])
+        self.assertFalse(np.allclose(first['transitionMatrix'], other['transitionMatrix']) and 
+                         np.allclose(first['observationMatrix'], other['observationMatrix']))
+        
+    @data((500, 4, 5, 3, 2))
+    @unpack
+    def testRandomSparseModel(self, stateNumber, actionNumber, observationNumber, successorNumber, observationSupport):
+        model=targetCode.randomSparseModel(stateNumber, actionNumber, observationNumber, successorNumber, observationSupport)
+        self.assertEqual((model.stateNumber, model.actionNumber, model.observationNumber), (stateNumber, actionNumber, observationNumber))
+        for T, O in zip(model.transitionMatrices, model.observationMatrices):
+            self.assertEqual(T.nnz, stateNumber*successorNumber)
+            assert_almost_equal(np.asarray(T.sum(axis=1)).ravel(), np.ones(stateNumber))
+            assert_almost_equal(np.asarray(O.sum(axis=1)).ravel(), np.ones(stateNumber))
+               
+    def tearDown(self):
+        pass
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
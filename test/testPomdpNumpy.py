@@ -2,11 +2,15 @@
 
 import sys
 sys.path.append('../src/')
+import json
+import pickle
 import numpy as np
+import scipy.sparse as sp
 
 import unittest
 from numpy.testing import assert_almost_equal
 from ddt import ddt, data, unpack
+import pomdpDomains
 import pomdpNumpy as targetCode
 
 @ddt
@@ -41,6 +45,34 @@ class TestStateEstimator(unittest.TestCase):
         calculatedResult=se(b, a, o)
         assert_almost_equal(calculatedResult, expectedResult, 5)
         
+    @data((np.array([[0.1, 0.5, 0.4], [1, 0, 0]]), 0, 1, np.array([[0.59949, 0.29847, 0.10204], [0, 0.9, 0.1]]), np.array([True, True])),
+          (np.array([[0.1, 0.5, 0.4], [1, 0, 0]]), 1, 0, np.array([[0, 0, 1], [0, 0, 0]]), np.array([True, False])))
+    @unpack
+    def testBatchUpdateMatchesStateEstimator(self, B, a, o, expectedBelief, expectedPossible):
+        se=targetCode.StateEstimator(self.transitionMatrix, self.observationMatrix)
+        calculatedResult=se.batchUpdate(B)
+        self.assertEqual(calculatedResult['belief'].shape, (2, 2, 3, 3))
+        assert_almost_equal(calculatedResult['belief'][:, a, o], expectedBelief, 5)
+        assert_almost_equal(calculatedResult['possible'][:, a, o], expectedPossible)
+        assert_almost_equal(calculatedResult['belief'][:, a, o], [se(b, a, o) for b in B])
+                    
+    @data((np.array([[0.1, 0.5, 0.4], [1, 0, 0]]), np.array([[[0.608, 0.392, 0], [0.4, 0.5, 0.1]], [[0.5, 0.5, 0], [0, 0, 1]]])))
+    @unpack
+    def testBatchUpdateObservationProbability(self, B, expectedResult):
+        se=targetCode.StateEstimator(self.transitionMatrix, self.observationMatrix)
+        calculatedResult=se.batchUpdate(B)
+        assert_almost_equal(calculatedResult['probability'], expectedResult, 5)
+        assert_almost_equal(calculatedResult['probability'].sum(axis=2), np.ones((2, 2)))
+        
+    @data((np.array([[0.1, 0.5, 0.4], [1, 0, 0], [1, 0, 0]]), np.array([0, 1, 0]), np.array([1, 0, 1])))
+    @unpack
+    def testGroupedUpdateMatchesStateEstimator(self, B, actions, observations):
+        se=targetCode.StateEstimator(self.transitionMatrix, self.observationMatrix)
+        calculatedResult=se.groupedUpdate(B, actions, observations)
+        assert_almost_equal(calculatedResult['belief'], [se(b, a, o) for b, a, o in zip(B, actions, observations)])
+        assert_almost_equal(calculatedResult['possible'], [True, False, True])
+        assert_almost_equal(calculatedResult['predicted'], [np.dot(b, self.transitionMatrix[:, a, :]) for b, a in zip(B, actions)])
+        
     def tearDown(self):
         pass
 
@@ -117,6 +149,18 @@ class TestGetBetaA(unittest.TestCase):
                                          self.observationMatrix, self.gamma)
         calculatedResult=getBetaA(V, b, a)
         assert_almost_equal(calculatedResult, expectedResult, 5)
+        
+    def testGetBetaAUsesCustomGetBetaAO(self):
+        V={'action': np.array([2, 2]), 'alpha': np.array([[0.2, 0.8], [0.6, 0.8]])}
+        calls=[]
+        def getBetaAO(V, b, a, o):
+            calls.append(o)
+            return np.ones(2)
+        getBetaA=targetCode.GetBetaA(getBetaAO, self.transitionMatrix, self.rewardMatrix, 
+                                     self.observationMatrix, self.gamma)
+        calculatedResult=getBetaA(V, np.array([0.6, 0.4]), 2)
+        self.assertEqual(calls, [0, 1, 2])
+        assert_almost_equal(calculatedResult, np.array([0, 0]), 5)
                 
     def tearDown(self):
         pass
@@ -164,6 +208,296 @@ class TestBackup(unittest.TestCase):
         pass
     
 
+@ddt
+class TestBatchBackup(unittest.TestCase):
+    
+    def setUp(self):
+        self.transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                        [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        self.rewardMatrix=np.array([[[-100, -100], [10, 10],     [-1, -1]],
+                                    [[10, 10],     [-100, -100], [-1, -1]]])
+        self.observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                         [[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]]])
+        self.gamma=1
+        self.backupEngine=targetCode.BatchBackup(self.transitionMatrix, self.rewardMatrix, 
+                                                 self.observationMatrix, self.gamma)
+    
+    @data(({'action':np.array([2, 2]), 'alpha': np.array([[0.2, 0.8], [0.6, 0.8]])},
+            np.array([[0.95, 0.05], [0.4, 0.6]]),
+            {'action':np.array([1, 2]), 'alpha':np.array([[10.7, -99.3], [-0.4, -0.2]])}))
+    @unpack    
+    def testBatchBackupAllBeliefs(self, V, B, expectedResult):
+        calculatedResult=self.backupEngine(V, B)
+        assert_almost_equal(calculatedResult['action'], expectedResult['action'])
+        assert_almost_equal(calculatedResult['alpha'], expectedResult['alpha'], 5)
+        
+    @data(({'action':np.array([2, 2]), 'alpha': np.array([[0.2, 0.8], [0.6, 0.8]])},
+            np.array([[0.95, 0.05], [0.4, 0.6], [0.5, 0.5]])))
+    @unpack    
+    def testBatchBackupMatchesPerBeliefBackup(self, V, B):
+        se=targetCode.StateEstimator(self.transitionMatrix, self.observationMatrix)
+        getBetaAO=targetCode.GetBetaAO(se, targetCode.argmaxAlpha)
+        def getBetaA(V, b, a):
+            oneStepReward=(self.rewardMatrix[:, a, :]*self.transitionMatrix[:, a, :]).sum(axis=1)
+            betaAO=np.array([getBetaAO(V, b, a, o) for o in range(self.observationMatrix.shape[2])])
+            longTermReward=np.dot(self.transitionMatrix[:, a, :], betaAO.T*self.observationMatrix[:, a, :]).sum(axis=1)
+            return oneStepReward+self.gamma*longTermReward
+        backup=targetCode.Backup(getBetaA, self.transitionMatrix)
+        calculatedResult=self.backupEngine(V, B)
+        expectedResult=[backup(V, b) for b in B]
+        assert_almost_equal(calculatedResult['action'], [alpha['action'] for alpha in expectedResult])
+        assert_almost_equal(calculatedResult['alpha'], [alpha['alpha'] for alpha in expectedResult], 5)
+            
+    def tearDown(self):
+        pass
+    
+
+@ddt
+class TestCompiledModel(unittest.TestCase):
+    
+    def setUp(self):
+        self.transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                        [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        self.rewardMatrix=np.array([[[-100, -100], [10, 10],     [-1, -1]],
+                                    [[10, 10],     [-100, -100], [-1, -1]]])
+        self.observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                         [[0, 0, 1], [0, 0, 1], [0.15, 0.85, 0]]])
+        
+    def testPrecomputedTerms(self):
+        model=targetCode.CompiledModel(self.transitionMatrix, self.rewardMatrix, self.observationMatrix)
+        assert_almost_equal(model.oneStepReward, [[-100, 10, -1], [10, -100, -1]])
+        assert_almost_equal(model.transitions[2], [[1, 0], [0, 1]])
+        assert_almost_equal(model.observationTransitions[2], [[0.85, 0.15, 0], [0.15, 0.85, 0]])
+        self.assertTrue(model.transitions.flags['C_CONTIGUOUS'])
+        self.assertEqual(model.transitions.dtype, np.float64)
+        stateActionReward=targetCode.CompiledModel(self.transitionMatrix, model.oneStepReward, self.observationMatrix)
+        assert_almost_equal(stateActionReward.oneStepReward, model.oneStepReward)
+        
+    @data((np.ones((2, 3, 3)), None, 'observation'), (None, np.ones((2, 2, 3))/3, 'observation'), 
+          (None, None, 'reward'), (np.full((2, 3, 2), np.nan), None, 'transition'))
+    @unpack
+    def testRejectsInvalidMatrices(self, transitionMatrix, observationMatrix, rewardShape):
+        transitionMatrix=self.transitionMatrix if transitionMatrix is None else transitionMatrix
+        observationMatrix=self.observationMatrix if observationMatrix is None else observationMatrix
+        rewardMatrix=np.zeros((3, 3)) if rewardShape == 'reward' else self.rewardMatrix
+        with self.assertRaises(ValueError):
+            targetCode.CompiledModel(transitionMatrix, rewardMatrix, observationMatrix)
+            
+    def testProbabilityCheckIsOptIn(self):
+        transitionMatrix=self.transitionMatrix.copy()
+        transitionMatrix[1, 2]=0
+        model=targetCode.CompiledModel(transitionMatrix, self.rewardMatrix, self.observationMatrix)
+        assert_almost_equal(model.transitions[2], [[1, 0], [0, 0]])
+        with self.assertRaises(ValueError):
+            targetCode.CompiledModel(transitionMatrix, self.rewardMatrix, self.observationMatrix, checkProbabilities=True)
+            
+    def testOneStepRewardLayoutMatchesSparseModel(self):
+        model=targetCode.CompiledModel(self.transitionMatrix, self.rewardMatrix, self.observationMatrix)
+        sparseModel=targetCode.toSparseModel(self.transitionMatrix, self.rewardMatrix, self.observationMatrix)
+        assert_almost_equal(model.oneStepReward, sparseModel.oneStepReward)
+            
+    @data((np.array([[0.95, 0.05], [0.4, 0.6], [0.5, 0.5]]), {'action':np.array([0, 2]), 'alpha': np.array([[0.2, 0.8], [0.6, -0.8]])}))
+    @unpack
+    def testConsumersAcceptCompiledModel(self, B, V):
+        model=targetCode.CompiledModel(self.transitionMatrix, self.rewardMatrix, self.observationMatrix)
+        se=targetCode.StateEstimator(self.transitionMatrix, self.observationMatrix)
+        compiledSe=targetCode.StateEstimator(model)
+        assert_almost_equal(compiledSe.batchUpdate(B)['belief'], se.batchUpdate(B)['belief'])
+        getBetaA=targetCode.GetBetaA(targetCode.GetBetaAO(compiledSe, targetCode.argmaxAlpha), model, gamma=0.9)
+        backup=targetCode.Backup(getBetaA, model)
+        expectedResult=targetCode.BatchBackup(self.transitionMatrix, self.rewardMatrix, self.observationMatrix, 0.9)(V, B)
+        for n, b in enumerate(B):
+            assert_almost_equal(backup(V, b)['alpha'], expectedResult['alpha'][n])
+        expand=targetCode.Expand(compiledSe, model, targetCode.furthestB)
+        assert_almost_equal(expand(B), targetCode.Expand(se, self.observationMatrix, targetCode.furthestB)(B))
+        
+    def tearDown(self):
+        pass
+
+
+@ddt
+class TestSparseModel(unittest.TestCase):
+    
+    def setUp(self):
+        self.transitionMatrix=np.array([[[0, 0.5, 0.5], [1, 0, 0]],
+                                        [[0.3, 0, 0.7], [0, 1, 0]],
+                                        [[0.8, 0.2, 0], [0, 0, 1]]])
+        self.rewardMatrix=np.array([[[-1, 2, 0], [0, 0, 0]],
+                                    [[3, 0, 1], [0, -5, 0]],
+                                    [[0, 4, 0], [0, 0, 2]]])
+        self.observationMatrix=np.array([[[0.5, 0.5, 0], [0, 0, 1]],
+                                         [[0.1, 0.9, 0], [0, 1, 0]],
+                                         [[0.9, 0.1, 0], [1, 0, 0]]])
+        self.gamma=0.9
+        self.model=targetCode.toSparseModel(self.transitionMatrix, self.rewardMatrix, self.observationMatrix)
+        
+    @data((np.array([0.1, 0.5, 0.4]), 0, 1), (np.array([1, 0, 0]), 1, 0))
+    @unpack
+    def testSparseStateEstimatorMatchesDense(self, b, a, o):
+        se=targetCode.StateEstimator(self.transitionMatrix, self.observationMatrix)
+        sparseSe=targetCode.SparseStateEstimator(self.model)
+        assert_almost_equal(sparseSe(b, a, o), se(b, a, o))
+        assert_almost_equal(sparseSe(sp.csr_matrix(b), a, o).toarray().ravel(), se(b, a, o))
+        
+    @data(np.array([[0.1, 0.5, 0.4], [1, 0, 0], [0, 0.5, 0.5]]))
+    def testSparseBatchUpdateMatchesDense(self, B):
+        denseResult=targetCode.StateEstimator(self.transitionMatrix, self.observationMatrix).batchUpdate(B)
+        sparseResult=targetCode.SparseStateEstimator(self.model).batchUpdate(sp.csr_matrix(B))
+        assert_almost_equal(sparseResult['belief'].toarray(), denseResult['belief'].reshape(-1, 3))
+        assert_almost_equal(sparseResult['probability'], denseResult['probability'])
+        assert_almost_equal(sparseResult['possible'], denseResult['possible'])
+        
+    @data(({'action':np.array([0, 1, 0]), 'alpha':np.array([[0, 1, 5], [10, 0, 1], [-1, 0, -10]])}, 
+           np.array([[0.1, 0.5, 0.4], [1, 0, 0], [0, 0.5, 0.5]])))
+    @unpack
+    def testSparseBatchBackupMatchesDense(self, V, B):
+        expectedResult=targetCode.BatchBackup(self.transitionMatrix, self.rewardMatrix, self.observationMatrix, self.gamma)(V, B)
+        sparseBackup=targetCode.SparseBatchBackup(self.model, self.gamma)
+        for beliefs in [B, sp.csr_matrix(B)]:
+            calculatedResult=sparseBackup(V, beliefs)
+            assert_almost_equal(calculatedResult['action'], expectedResult['action'])
+            assert_almost_equal(calculatedResult['alpha'], expectedResult['alpha'])
+            
+    @data(np.array([[0.1, 0.5, 0.4], [1, 0, 0]]))
+    def testSparseExpandMatchesDense(self, B):
+        expectedResult=targetCode.Expand(targetCode.StateEstimator(self.transitionMatrix, self.observationMatrix), 
+                                         self.observationMatrix, targetCode.furthestB)(B)
+        expand=targetCode.Expand(targetCode.SparseStateEstimator(self.model), None, targetCode.furthestB)
+        calculatedResult=expand(sp.csr_matrix(B))
+        assert_almost_equal(calculatedResult.toarray(), expectedResult)
+        
+    @data(np.array([[0.1, 0.5, 0.4], [1, 0, 0]]))
+    def testSparseExpandOnDenseBeliefs(self, B):
+        expectedResult=targetCode.Expand(targetCode.StateEstimator(self.transitionMatrix, self.observationMatrix), 
+                                         self.observationMatrix, targetCode.furthestB)(B)
+        calculatedResult=targetCode.Expand(targetCode.SparseStateEstimator(self.model), self.model, targetCode.furthestB)(B)
+        self.assertIsInstance(calculatedResult, np.ndarray)
+        assert_almost_equal(calculatedResult, expectedResult)
+               
+    def tearDown(self):
+        pass
+
+
+@ddt
+class TestCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.transitionMatrix=np.array([[[0, 0.5, 0.5], [1, 0, 0]],
+                                        [[0.3, 0, 0.7], [0, 1, 0]],
+                                        [[0.8, 0.2, 0], [0, 0, 1]]])
+        self.observationMatrix=np.array([[[0.5, 0.5, 0], [0, 0, 1]],
+                                         [[0.1, 0.9, 0], [0, 1, 0]],
+                                         [[0.9, 0.1, 0], [1, 0, 0]]])
+        self.rewardMatrix=np.arange(18, dtype=float).reshape(3, 2, 3)
+        self.se=targetCode.StateEstimator(self.transitionMatrix, self.observationMatrix)
+        self.B=np.array([[0.1, 0.5, 0.4], [1, 0, 0], [0.2, 0.2, 0.6]])
+        
+    @data((3, 0, []), (4, 1, [1]), (5, 2, [1, 2]))
+    @unpack
+    def testLRUEvictsLeastRecentlyUsed(self, entryNumber, expectedEvictions, evictedKeys):
+        cache=targetCode.LRUCache(3*np.zeros(4).nbytes)
+        for key in range(entryNumber):
+            if key == 3:
+                cache.get(0)
+            cache.put(key, np.zeros(4))
+        self.assertEqual(cache.evictions, expectedEvictions)
+        self.assertLessEqual(cache.bytes, cache.maxBytes)
+        self.assertEqual([key for key in range(entryNumber) if cache.get(key) is None], evictedKeys)
+            
+    def testCachedStateEstimatorMatchesAndCounts(self):
+        se=targetCode.CachedStateEstimator(self.se)
+        for b in self.B:
+            assert_almost_equal(se(b, 0, 1), self.se(b, 0, 1))
+            assert_almost_equal(se(b, 0, 1), self.se(b, 0, 1))
+        self.assertEqual(se.cache.stats()['hits'], 3)
+        self.assertEqual(se.cache.stats()['misses'], 3)
+        
+    def testCachedBatchUpdateOnlyComputesNewBeliefs(self):
+        se=targetCode.CachedStateEstimator(self.se)
+        se.batchUpdate(self.B[:2])
+        calculatedResult=se.batchUpdate(self.B)
+        expectedResult=self.se.batchUpdate(self.B)
+        for name in expectedResult:
+            assert_almost_equal(calculatedResult[name], expectedResult[name])
+        self.assertEqual((se.cache.hits, se.cache.misses), (2, 3))
+        
+    def testCachedEntriesAreIsolatedFromCallers(self):
+        se=targetCode.CachedStateEstimator(self.se)
+        bPrime=se(self.B[0], 0, 1)
+        with self.assertRaises(ValueError):
+            bPrime[0]=-1
+        se.batchUpdate(self.B)
+        for key, value in se.cache.entries.items():
+            if key[0] != 'batch':
+                continue
+            for row in value[0].values():
+                self.assertIsNone(row.base)
+                self.assertFalse(row.flags.writeable)
+        assert_almost_equal(se(self.B[0], 0, 1), self.se(self.B[0], 0, 1))
+        
+    def testSharedCacheKeepsModelsApart(self):
+        cache=targetCode.LRUCache()
+        recalibrated=self.observationMatrix[:, :, [1, 0, 2]]
+        for observationMatrix in [self.observationMatrix, recalibrated]:
+            se=targetCode.StateEstimator(self.transitionMatrix, observationMatrix)
+            cached=targetCode.CachedStateEstimator(se, cache)
+            assert_almost_equal(cached(self.B[0], 0, 1), se(self.B[0], 0, 1))
+            assert_almost_equal(cached.batchUpdate(self.B)['belief'], se.batchUpdate(self.B)['belief'])
+            V={'action':np.array([0]), 'alpha':np.array([[0.2, 0.8, 1]])}
+            expectedResult=targetCode.BatchBackup(self.transitionMatrix, self.rewardMatrix, observationMatrix, 0.9)(V, self.B)
+            calculatedResult=targetCode.BatchBackup(self.transitionMatrix, self.rewardMatrix, observationMatrix, 0.9, cache)(V, self.B)
+            assert_almost_equal(calculatedResult['alpha'], expectedResult['alpha'])
+        self.assertEqual(cache.hits, 0)
+        
+    def testLRUIsThreadSafeAndPicklable(self):
+        cache=targetCode.LRUCache(64*np.zeros(4).nbytes)
+        def work(start):
+            for key in range(start, start+500):
+                cache.put(key%100, np.zeros(4))
+                cache.get((key*7)%100)
+        with targetCode.WorkerPool(4, 'thread') as pool:
+            pool.start()
+            list(pool.executor.map(work, range(0, 4000, 500)))
+        self.assertLessEqual(cache.bytes, cache.maxBytes)
+        self.assertEqual(cache.bytes, len(cache)*np.zeros(4).nbytes)
+        copied=pickle.loads(pickle.dumps(cache))
+        self.assertEqual(len(copied), len(cache))
+        copied.put(-1, np.zeros(4))
+        
+    def testCachedSparseEstimatorExpandsDenseBeliefs(self):
+        model=targetCode.toSparseModel(self.transitionMatrix, self.rewardMatrix, self.observationMatrix)
+        cached=targetCode.Expand(targetCode.CachedStateEstimator(targetCode.SparseStateEstimator(model)), model, targetCode.furthestB)
+        plain=targetCode.Expand(self.se, self.observationMatrix, targetCode.furthestB)
+        assert_almost_equal(cached(self.B), plain(self.B))
+        
+    def testExpandWithBoundedCache(self):
+        cache=targetCode.LRUCache(2*self.se.batchUpdate(self.B[:1])['belief'].nbytes)
+        cached=targetCode.Expand(targetCode.CachedStateEstimator(self.se, cache), self.observationMatrix, targetCode.furthestB)
+        plain=targetCode.Expand(self.se, self.observationMatrix, targetCode.furthestB)
+        B, BPlain=self.B, self.B
+        for i in range(3):
+            B, BPlain=cached(B), plain(BPlain)
+            assert_almost_equal(B, BPlain)
+            self.assertLessEqual(cache.bytes, cache.maxBytes)
+        self.assertGreater(cache.evictions, 0)
+        
+    @data(({'action':np.array([0, 1]), 'alpha': np.array([[0.2, 0.8, 1], [0.6, 0.8, -1]])},))
+    @unpack
+    def testBatchBackupReusesProjections(self, V):
+        cache=targetCode.LRUCache()
+        cached=targetCode.BatchBackup(self.transitionMatrix, self.rewardMatrix, self.observationMatrix, 0.9, cache)
+        plain=targetCode.BatchBackup(self.transitionMatrix, self.rewardMatrix, self.observationMatrix, 0.9)
+        for B in [self.B, self.B[::-1]]:
+            calculatedResult=cached(V, B)
+            expectedResult=plain(V, B)
+            assert_almost_equal(calculatedResult['alpha'], expectedResult['alpha'])
+            assert_almost_equal(calculatedResult['action'], expectedResult['action'])
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        
+    def tearDown(self):
+        pass
+
+
 @ddt
 class TestFurthestB(unittest.TestCase):
     
@@ -172,10 +506,67 @@ class TestFurthestB(unittest.TestCase):
     def testFurthestB(self, successors, B, expectedResult):
         calculatedResult=targetCode.furthestB(successors, B)
         assert_almost_equal(calculatedResult, expectedResult)
+        
+    @data(1, 3, 7, 2**21)
+    def testMinL1DistanceBlocksOverBothSets(self, blockElements):
+        random=np.random.RandomState(0)
+        X, B=random.dirichlet(np.ones(3), 11), random.dirichlet(np.ones(3), 5)
+        expectedResult=abs(X[:, np.newaxis, :]-B[np.newaxis, :, :]).sum(axis=2).min(axis=1)
+        calculatedResult=targetCode.minL1Distance(X, B, 2, blockElements)
+        assert_almost_equal(calculatedResult, expectedResult)
                
     def tearDown(self):
         pass
 
+@ddt
+class TestBeliefIndex(unittest.TestCase):
+    
+    def setUp(self):
+        random=np.random.RandomState(0)
+        self.B=random.dirichlet(np.ones(4), 50)
+        self.newBeliefs=random.dirichlet(np.ones(4), 30)
+        self.queries=random.dirichlet(np.ones(4), 20)
+        
+    def bruteForceDistance(self, X, B):
+        return np.array([min(abs(B-x).sum(axis=1)) for x in X])
+    
+    @data(targetCode.BruteForceIndex, targetCode.KDTreeIndex)
+    def testQueryAfterIncrementalAdd(self, beliefIndex):
+        index=beliefIndex(self.B)
+        assert_almost_equal(index.query(self.queries), self.bruteForceDistance(self.queries, self.B))
+        for bNew in self.newBeliefs:
+            index.add(bNew)
+        self.assertEqual(len(index), 80)
+        assert_almost_equal(index.query(self.queries), self.bruteForceDistance(self.queries, np.vstack((self.B, self.newBeliefs))))
+        
+    @data(targetCode.BruteForceIndex, targetCode.KDTreeIndex)
+    def testFurthestBWithIndex(self, beliefIndex):
+        expectedResult=targetCode.furthestB(self.queries, self.B)
+        calculatedResult=targetCode.furthestB(self.queries, beliefIndex(self.B))
+        assert_almost_equal(calculatedResult, expectedResult)
+        
+    @data(targetCode.BruteForceIndex, targetCode.KDTreeIndex)
+    def testExpandKeepsIndexInSync(self, beliefIndex):
+        transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                   [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                    [[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]]])
+        se=targetCode.StateEstimator(transitionMatrix, observationMatrix)
+        expectedResult=np.array([[0.5, 0.5]])
+        calculatedResult=targetCode.BeliefSet(expectedResult)
+        plainExpand=targetCode.Expand(se, observationMatrix, targetCode.furthestB)
+        indexedExpand=targetCode.Expand(se, observationMatrix, targetCode.furthestB, beliefIndex)
+        for i in range(3):
+            expectedResult=plainExpand(expectedResult)
+            indexedNumber=len(calculatedResult)
+            calculatedResult=indexedExpand(calculatedResult)
+            self.assertEqual(len(indexedExpand.index), indexedNumber)
+        assert_almost_equal(calculatedResult.view(), expectedResult)
+        
+    def tearDown(self):
+        pass
+
+
 @ddt
 class TestArgmax(unittest.TestCase):
     
@@ -256,6 +647,139 @@ class TestImprove(unittest.TestCase):
         pass
 
 
+@ddt
+class TestValueFunction(unittest.TestCase):
+    
+    @data((np.array([[2, 5], [4, 9]]), np.array([1, 5]), 0, np.array([4, 9]), True),
+          (np.array([[2, 5], [4, 9]]), np.array([1, 5]), 0, np.array([5, 4]), False),
+          (np.array([[2, 5], [4, 9]]), np.array([1, 5]), 0, np.array([4, 9.001]), False),
+          (np.array([[2, 5], [4, 9]]), np.array([1, 5]), 0.01, np.array([4, 9.001]), True))
+    @unpack
+    def testContains(self, alpha, action, tolerance, newAlpha, expectedResult):
+        V=targetCode.ValueFunction(alpha, action, tolerance)
+        self.assertEqual(newAlpha in V, expectedResult)
+        
+    @data((np.array([[2, 5]]), 1, np.array([[4, 9], [6, 1], [0, 3]]), np.array([5, 7, 9]),
+           {'action': np.array([1, 5, 7, 9]), 'alpha': np.array([[2, 5], [4, 9], [6, 1], [0, 3]])}))
+    @unpack
+    def testAppendGrowsBuffer(self, alpha, action, newAlpha, newAction, expectedResult):
+        V=targetCode.ValueFunction(alpha, action)
+        for element, a in zip(newAlpha, newAction):
+            V.append(element, a)
+        self.assertEqual(len(V), 4)
+        assert_almost_equal(V['action'], expectedResult['action'])
+        assert_almost_equal(V['alpha'], expectedResult['alpha'])
+        
+    @data((np.array([[2, 5], [4, 9], [4, 9], [10, 0], [3, 3]]), np.array([1, 5, 6, 7, 8]), None,
+           3, {'action': np.array([5, 7]), 'alpha': np.array([[4, 9], [10, 0]])}),
+          (np.array([[2, 5], [4, 9], [10, 0], [6, 6]]), np.array([1, 5, 7, 8]), np.array([[0, 1], [1, 0]]),
+           2, {'action': np.array([5, 7]), 'alpha': np.array([[4, 9], [10, 0]])}))
+    @unpack
+    def testPrune(self, alpha, action, B, expectedRemoved, expectedResult):
+        V=targetCode.ValueFunction(alpha, action)
+        removedNumber=V.prune(B)
+        self.assertEqual(removedNumber, expectedRemoved)
+        assert_almost_equal(V['action'], expectedResult['action'])
+        assert_almost_equal(V['alpha'], expectedResult['alpha'])
+        self.assertNotIn(np.array([2, 5]), V)
+               
+    def tearDown(self):
+        pass
+
+
+@ddt
+class TestImprovePrune(unittest.TestCase):
+    
+    @data(({'action': np.array([1, 5]), 'alpha': np.array([[2, 5], [4, 9]])}, np.array([[1, 7], [5, 8]]), 
+           lambda V, b: {'action': 15, 'alpha': np.array([6, 10])},
+           3, {'action': np.array([15]), 'alpha': np.array([[6, 10]])}))
+    @unpack
+    def testImprovePrunesDominated(self, V, B, backup, expectedRemoved, expectedResult):
+        improve=targetCode.Improve(backup, pruneDominated=True)
+        calculatedResult=improve(V, B)
+        self.assertEqual(improve.prunedNumber, expectedRemoved)
+        assert_almost_equal(calculatedResult['action'], expectedResult['action'])
+        assert_almost_equal(calculatedResult['alpha'], expectedResult['alpha'])
+
+    def tearDown(self):
+        pass
+
+
+@ddt
+class TestRandomizedImprove(unittest.TestCase):
+
+    def setUp(self):
+        transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                   [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        rewardMatrix=np.array([[[-100, -100], [10, 10],     [-1, -1]],
+                               [[10, 10],     [-100, -100], [-1, -1]]])
+        observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                    [[0, 0, 1], [0, 0, 1], [0.15, 0.85, 0]]])
+        self.backupEngine=targetCode.BatchBackup(transitionMatrix, rewardMatrix, observationMatrix, 0.9)
+        self.V={'action': 2, 'alpha': np.array([[-1000, -1000]])}
+        self.B=np.array([[0.01*n, 1-0.01*n] for n in range(101)])
+
+    @data(({'action': np.array([1, 5]), 'alpha': np.array([[2, 5], [4, 9]])}, np.array([[1, 7], [5, 8]]),
+           lambda V, b: {'action': 15, 'alpha': np.array([6, 10])},
+           {'action': np.array([15]), 'alpha': np.array([[6, 10]])}),
+          ({'action': np.array([1, 5]), 'alpha': np.array([[2, 5], [4, 9]])}, np.array([[1, 7], [5, 8]]),
+           lambda V, b: {'action': 15, 'alpha': np.array([-6, -10])},
+           {'action': np.array([5]), 'alpha': np.array([[4, 9]])}))
+    @unpack
+    def testOneBackupCoversAllBeliefs(self, V, B, backup, expectedResult):
+        improve=targetCode.RandomizedImprove(backup, seed=0)
+        calculatedResult=improve(V, B)
+        self.assertEqual(improve.backupNumber, 1)
+        assert_almost_equal(calculatedResult['action'], expectedResult['action'])
+        assert_almost_equal(calculatedResult['alpha'], expectedResult['alpha'])
+
+    @data(0, 1, 2)
+    def testStageNeverLowersValue(self, seed):
+        improve=targetCode.RandomizedImprove(self.backupEngine, seed=seed)
+        V=self.V
+        for i in range(5):
+            VNew=improve(V, self.B)
+            self.assertLess(improve.backupNumber, self.B.shape[0])
+            self.assertTrue((np.dot(self.B, VNew['alpha'].T).max(axis=1) >= np.dot(self.B, V['alpha'].T).max(axis=1)-1e-9).all())
+            V=VNew
+
+    def testStageProjectsOncePerAction(self):
+        B=self.B[::5]
+        projected=[]
+        project=self.backupEngine.project
+        self.backupEngine.project=lambda V, a: projected.append(a) or project(V, a)
+        improve=targetCode.RandomizedImprove(self.backupEngine, epsilon=1, seed=0)
+        VNew=improve(self.V, B)
+        self.assertGreater(improve.backupNumber, improve.sweepNumber)
+        self.assertEqual(projected, list(range(self.backupEngine.actionNumber))*improve.sweepNumber)
+        del self.backupEngine.project
+        expectedResult=targetCode.RandomizedImprove(self.backupEngine, epsilon=1, seed=0)(self.V, B)
+        assert_almost_equal(VNew['alpha'], expectedResult['alpha'])
+
+    def testEpsilonRunsStagesUntilConverged(self):
+        B=self.B[::5]
+        improve=targetCode.RandomizedImprove(self.backupEngine, epsilon=1, seed=0)
+        V=improve(self.V, B)
+        self.assertLess(improve.residual, 1)
+        self.assertGreater(improve.sweepNumber, 2)
+        full=targetCode.Improve(self.backupEngine, epsilon=1)
+        VFull=full(self.V, B)
+        self.assertLess(improve.backupNumber, full.backupNumber)
+        self.assertLess(abs(np.dot(B, V['alpha'].T).max(axis=1)-np.dot(B, VFull['alpha'].T).max(axis=1)).max(), 10)
+
+    def testPlugsIntoPBVI(self):
+        improve=targetCode.RandomizedImprove(self.backupEngine, seed=0)
+        expand=lambda B: B
+        pbvi=targetCode.PBVI(improve, expand, targetCode.getPolicy, self.V, 3, targetCode.SolverStats())
+        V=pbvi(self.B)
+        self.assertEqual(len(pbvi.stats.records), 3)
+        self.assertTrue(all(record['backupNumber'] < self.B.shape[0] for record in pbvi.stats.records))
+        self.assertGreater(np.dot(self.B, V['alpha'].T).max(axis=1).min(), -1000)
+
+    def tearDown(self):
+        pass
+
+
 @ddt
 class TestExpand(unittest.TestCase):
     
@@ -280,11 +804,310 @@ class TestExpand(unittest.TestCase):
         expand=targetCode.Expand(se, self.observationMatrix, selectBelief)
         calculatedResult=expand(B)
         assert_almost_equal(calculatedResult, expectedResult)
+        
+    @data(3, 6, 256)
+    def testExpandUpdatesBeliefsInBlocks(self, blockSize):
+        transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                   [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        se=targetCode.StateEstimator(transitionMatrix, self.observationMatrix)
+        B=np.array([[0.05*n, 1-0.05*n] for n in range(21)])
+        expand=targetCode.Expand(se, self.observationMatrix, targetCode.furthestB, blockSize=blockSize)
+        blockSizes=[]
+        batchUpdate=expand.batchUpdate
+        expand.batchUpdate=lambda B: blockSizes.append(B.shape[0]) or batchUpdate(B)
+        calculatedResult=expand(B)
+        self.assertEqual(max(blockSizes), min(max(blockSize//9, 1), B.shape[0]))
+        self.assertEqual(expand.beliefUpdateNumber, B.shape[0]*9)
+        assert_almost_equal(calculatedResult, targetCode.Expand(se, self.observationMatrix, targetCode.furthestB)(B))
                
     def tearDown(self):
         pass
 
 
+@ddt
+class TestBeliefSet(unittest.TestCase):
+    
+    @data((np.array([[0.2, 0.8]]), [np.array([0.5, 0.5]), np.array([[0.1, 0.9], [0.7, 0.3]])], 
+           np.array([[0.2, 0.8], [0.5, 0.5], [0.1, 0.9], [0.7, 0.3]])))
+    @unpack
+    def testAppend(self, B, newBeliefs, expectedResult):
+        beliefSet=targetCode.BeliefSet(B)
+        for bNew in newBeliefs:
+            beliefSet.append(bNew)
+        self.assertEqual(len(beliefSet), 4)
+        self.assertEqual(beliefSet.shape, (4, 2))
+        self.assertGreaterEqual(beliefSet.buffer.shape[0], 4)
+        assert_almost_equal(beliefSet.view(), expectedResult)
+        
+    @data(np.array([[0.2, 0.8], [0.5, 0.5]]))
+    def testViewIsNotACopy(self, B):
+        beliefSet=targetCode.BeliefSet(B)
+        self.assertTrue(np.shares_memory(beliefSet.view(), beliefSet.buffer))
+        self.assertTrue(np.shares_memory(np.asarray(beliefSet), beliefSet.buffer))
+        
+    @data((np.array([[2, 5], [4, 9]]), np.float32), (np.array([[2, 5], [4, 9]]), None))
+    @unpack
+    def testDtype(self, B, dtype):
+        beliefSet=targetCode.BeliefSet(B, dtype)
+        self.assertEqual(beliefSet.dtype, np.float32 if dtype else np.float64)
+        
+    @data((np.array([[2, 5], [4, 9]]), lambda b, a, o: np.array([3, 9]),
+           lambda successors, B: successors[0],
+           np.array([[2, 5], [4, 9], [3, 9], [3, 9]])))
+    @unpack
+    def testExpandAppendsInPlace(self, B, se, selectBelief, expectedResult):
+        observationMatrix=np.zeros((2, 1, 1))
+        beliefSet=targetCode.BeliefSet(B)
+        calculatedResult=targetCode.Expand(se, observationMatrix, selectBelief)(beliefSet)
+        self.assertIs(calculatedResult, beliefSet)
+        assert_almost_equal(calculatedResult.view(), expectedResult)
+        
+    def tearDown(self):
+        pass
+
+
+@ddt
+class TestParallel(unittest.TestCase):
+    
+    def setUp(self):
+        self.transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                        [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        self.rewardMatrix=np.array([[[-100, -100], [10, 10],     [-1, -1]],
+                                    [[10, 10],     [-100, -100], [-1, -1]]])
+        self.observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                         [[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]]])
+        self.gamma=0.5
+        self.backupEngine=targetCode.BatchBackup(self.transitionMatrix, self.rewardMatrix, self.observationMatrix, self.gamma)
+        self.expand=targetCode.Expand(targetCode.StateEstimator(self.transitionMatrix, self.observationMatrix), 
+                                      self.observationMatrix, targetCode.furthestB)
+        self.V={'action': 2, 'alpha': np.array([[-200, -200]])}
+        self.B=np.array([[0.05*n, 1-0.05*n] for n in range(21)])
+        
+    def solve(self, improve, expand):
+        return targetCode.PBVI(improve, expand, targetCode.getPolicy, self.V, 3)(self.B)
+    
+    @data(('thread', 3), ('process', 2))
+    @unpack
+    def testParallelPBVIMatchesSerial(self, mode, workerNumber):
+        expectedResult=self.solve(targetCode.Improve(self.backupEngine), self.expand)
+        with targetCode.WorkerPool(workerNumber, mode) as pool:
+            improve=targetCode.Improve(targetCode.ParallelBackup(self.backupEngine, pool))
+            calculatedResult=self.solve(improve, targetCode.ParallelExpand(self.expand, pool))
+        assert_almost_equal(calculatedResult['action'], expectedResult['action'])
+        assert_almost_equal(calculatedResult['alpha'], expectedResult['alpha'])
+        
+    @data((4, 10, [(0, 2), (2, 5), (5, 7), (7, 10)]), (4, 2, [(0, 1), (1, 2)]), (4, 0, [(0, 0)]))
+    @unpack
+    def testShards(self, workerNumber, size, expectedResult):
+        pool=targetCode.WorkerPool(workerNumber)
+        self.assertEqual(pool.shards(size), expectedResult)
+        
+    def tearDown(self):
+        pass
+
+
+@ddt
+class TestSolverStats(unittest.TestCase):
+    
+    def setUp(self):
+        transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                   [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        rewardMatrix=np.array([[[-100, -100], [10, 10],     [-1, -1]],
+                               [[10, 10],     [-100, -100], [-1, -1]]])
+        observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                    [[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]]])
+        self.improve=targetCode.Improve(targetCode.BatchBackup(transitionMatrix, rewardMatrix, observationMatrix, 0.5))
+        self.expand=targetCode.Expand(targetCode.StateEstimator(transitionMatrix, observationMatrix), observationMatrix, targetCode.furthestB)
+        self.V={'action': 2, 'alpha': np.array([[-200, -200]])}
+        
+    @data((np.array([[0.5, 0.5]]), 3, [1, 2, 4], [2, 4, 8]))
+    @unpack
+    def testRecordsEveryIteration(self, B, expansionNumber, expectedBeliefNumber, expectedExpandedBeliefNumber):
+        callbackRecords=[]
+        stats=targetCode.SolverStats(callbackRecords.append)
+        expectedResult=targetCode.PBVI(self.improve, self.expand, targetCode.getPolicy, self.V, expansionNumber)(B)
+        calculatedResult=targetCode.PBVI(self.improve, self.expand, targetCode.getPolicy, self.V, expansionNumber, stats)(B)
+        assert_almost_equal(calculatedResult['alpha'], expectedResult['alpha'])
+        self.assertEqual(callbackRecords, stats.records)
+        self.assertEqual([record['iteration'] for record in stats.records], list(range(expansionNumber)))
+        self.assertEqual([record['beliefNumber'] for record in stats.records], expectedBeliefNumber)
+        self.assertEqual([record['expandedBeliefNumber'] for record in stats.records], expectedExpandedBeliefNumber)
+        self.assertEqual([record['backupNumber'] for record in stats.records], 
+                         [beliefNumber*record['sweepNumber'] for beliefNumber, record in zip(expectedBeliefNumber, stats.records)])
+        self.assertEqual([record['beliefUpdateNumber'] for record in stats.records], [9*beliefNumber for beliefNumber in expectedBeliefNumber])
+        self.assertEqual(stats.records[-1]['alphaNumber'], len(calculatedResult['alpha']))
+        self.assertGreater(stats.records[0]['bellmanResidual'], 0)
+        
+    @data(np.array([[0.5, 0.5]]))
+    def testExport(self, B):
+        stats=targetCode.SolverStats()
+        targetCode.PBVI(self.improve, self.expand, targetCode.getPolicy, self.V, 2, stats)(B)
+        self.assertEqual(json.loads(stats.toJSON()), stats.records)
+        lines=stats.toCSV().splitlines()
+        self.assertEqual(lines[0].split(','), targetCode.SolverStats.fields)
+        self.assertEqual(len(lines), 3)
+        
+    def tearDown(self):
+        pass
+
+
+@ddt
+class TestWarmStart(unittest.TestCase):
+    
+    def setUp(self):
+        transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                   [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        rewardMatrix=np.array([[[-100, -100], [10, 10],     [-1, -1]],
+                               [[10, 10],     [-100, -100], [-1, -1]]])
+        observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                    [[0, 0, 1], [0, 0, 1], [0.15, 0.85, 0]]])
+        self.transitionMatrix, self.rewardMatrix, self.observationMatrix=transitionMatrix, rewardMatrix, observationMatrix
+        improve=targetCode.Improve(targetCode.BatchBackup(transitionMatrix, rewardMatrix, observationMatrix, 0.5), 
+                                   pruneDominated=True, pruneUnused=True)
+        expand=targetCode.Expand(targetCode.StateEstimator(transitionMatrix, observationMatrix), observationMatrix, targetCode.furthestB)
+        self.pbvi=targetCode.PBVI(improve, expand, targetCode.getPolicy, {'action': 2, 'alpha': np.array([[-200, -200]])}, 2)
+        
+    @data((np.array([[0.5, 0.5]]), np.array([[0.9, 0.1]])))
+    @unpack
+    def testContinuesFromState(self, BFirst, BSecond):
+        VFirst=self.pbvi(BFirst)
+        state=self.pbvi.state
+        firstBeliefs=state['B'].view().copy()
+        assert_almost_equal(state['V']['alpha'], VFirst['alpha'])
+        VSecond=self.pbvi(BSecond, state)
+        assert_almost_equal(state['B'].view(), firstBeliefs)
+        secondBeliefs=self.pbvi.state['B'].view()
+        assert_almost_equal(secondBeliefs[:len(firstBeliefs)], firstBeliefs)
+        assert_almost_equal(secondBeliefs[len(firstBeliefs)], BSecond[0])
+        self.assertLessEqual(len(secondBeliefs), len(firstBeliefs)+4)
+        valueFirst=np.dot(firstBeliefs, VFirst['alpha'].T).max(axis=1)
+        valueSecond=np.dot(firstBeliefs, VSecond['alpha'].T).max(axis=1)
+        self.assertTrue((valueSecond >= valueFirst-1e-9).all())
+        
+    @data(np.array([[0.5, 0.5]]))
+    def testKnownBeliefIsNotDuplicated(self, B):
+        self.pbvi(B)
+        state=self.pbvi.state
+        self.pbvi(B, state)
+        self.assertEqual(len(self.pbvi.state['B']), len(state['B']))
+        
+    @data((np.array([[0.5, 0.5]]), np.array([[0.9, 0.1], [0.5, 0.5]])))
+    @unpack
+    def testContinuesFromSparseState(self, BFirst, BSecond):
+        model=targetCode.toSparseModel(self.transitionMatrix, self.rewardMatrix, self.observationMatrix)
+        pbvi=targetCode.PBVI(targetCode.Improve(targetCode.SparseBatchBackup(model, 0.5)), 
+                             targetCode.Expand(targetCode.SparseStateEstimator(model), model, targetCode.furthestB), 
+                             targetCode.getPolicy, {'action': 2, 'alpha': np.array([[-200, -200]])}, 2)
+        pbvi(sp.csr_matrix(BFirst))
+        state=pbvi.state
+        self.assertTrue(sp.issparse(state['B']))
+        VSecond=pbvi(sp.csr_matrix(BSecond), state)
+        secondBeliefs=pbvi.state['B']
+        self.assertTrue(sp.issparse(secondBeliefs))
+        assert_almost_equal(secondBeliefs[:state['B'].shape[0]].toarray(), state['B'].toarray())
+        assert_almost_equal(secondBeliefs[state['B'].shape[0]].toarray(), BSecond[:1])
+        denseBeliefs=state['B'].toarray()
+        self.assertTrue((np.dot(denseBeliefs, VSecond['alpha'].T).max(axis=1) >= 
+                         np.dot(denseBeliefs, state['V']['alpha'].T).max(axis=1)-1e-9).all())
+        
+    def tearDown(self):
+        pass
+
+
+@ddt
+class TestCompiledPolicy(unittest.TestCase):
+    
+    @data(({'action': np.array([1, 5, 5, 5]), 'alpha': np.array([[100, 5], [4, 9], [3, 15], [5, 7]])}, 
+           np.array([[0.9, 0.1], [0.5, 0.5], [0.1, 0.9], [0, 1]]), np.array([1, 5])),
+          ({'action': np.array([2, 0, 2, 1]), 'alpha': np.array([[2, 5], [4, 9], [3, 6], [5, 7]])}, 
+           np.array([[0.9, 0.1], [0.5, 0.5], [0.2, 0.8]]), np.array([0, 1, 2])))
+    @unpack
+    def testMatchesPerBeliefFunctions(self, V, B, expectedActions):
+        policy=targetCode.CompiledPolicy(V)
+        assert_almost_equal(policy.actions, expectedActions)
+        calculatedResult=policy.evaluate(B)
+        assert_almost_equal(calculatedResult['action'], [targetCode.getPolicy(V, b) for b in B])
+        assert_almost_equal(calculatedResult['value'], [np.dot(V['alpha'], b).max() for b in B])
+        assert_almost_equal(calculatedResult['q'], [[targetCode.evaluateAction(V, b, a) for a in expectedActions] for b in B])
+        assert_almost_equal(policy(B), calculatedResult['action'])
+        assert_almost_equal(policy.value(B), calculatedResult['value'])
+        assert_almost_equal(policy.qValues(B), calculatedResult['q'])
+        
+    @data(({'action': np.array([1, 5]), 'alpha': np.array([[2, 5], [4, 9]])}, np.array([0.5, 0.5]), 5, 6.5))
+    @unpack
+    def testSingleBeliefFloat32(self, V, b, expectedAction, expectedValue):
+        policy=targetCode.CompiledPolicy(V, np.float32)
+        self.assertEqual(policy.alpha.dtype, np.float32)
+        self.assertTrue(policy.alpha.flags['C_CONTIGUOUS'])
+        self.assertEqual(policy(b), expectedAction)
+        self.assertAlmostEqual(policy.value(b), expectedValue, 5)
+        self.assertEqual(policy.value(b).dtype, np.float32)
+        
+    def tearDown(self):
+        pass
+
+
+@ddt
+class TestAnytime(unittest.TestCase):
+    
+    def setUp(self):
+        transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                   [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        rewardMatrix=np.array([[[-100, -100], [10, 10],     [-1, -1]],
+                               [[10, 10],     [-100, -100], [-1, -1]]])
+        observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                    [[0, 0, 1], [0, 0, 1], [0.15, 0.85, 0]]])
+        self.backupEngine=targetCode.BatchBackup(transitionMatrix, rewardMatrix, observationMatrix, 0.9)
+        self.expand=targetCode.Expand(targetCode.StateEstimator(transitionMatrix, observationMatrix), observationMatrix, targetCode.furthestB)
+        self.V={'action': 2, 'alpha': np.array([[-1000, -1000]])}
+        self.B=np.array([[0.05*n, 1-0.05*n] for n in range(21)])
+        
+    @data(1, 0.01)
+    def testImproveStopsBelowEpsilon(self, epsilon):
+        improve=targetCode.Improve(self.backupEngine, epsilon=epsilon)
+        improve(self.V, self.B)
+        self.assertLess(improve.residual, epsilon)
+        self.assertGreater(improve.sweepNumber, 2)
+        
+    def testSmallerEpsilonSweepsLonger(self):
+        coarse=targetCode.Improve(self.backupEngine, epsilon=1)
+        fine=targetCode.Improve(self.backupEngine, epsilon=0.01)
+        VCoarse=coarse(self.V, self.B)
+        VFine=fine(self.V, self.B)
+        self.assertGreater(fine.sweepNumber, coarse.sweepNumber)
+        self.assertTrue((np.dot(self.B, VFine['alpha'].T).max(axis=1) >= np.dot(self.B, VCoarse['alpha'].T).max(axis=1)-1e-9).all())
+        
+    def testEpsilonSweepsKeepValueFunctionSmall(self):
+        improve=targetCode.Improve(self.backupEngine, epsilon=1e-6, maxSweeps=50)
+        VImproved=improve(self.V, self.B)
+        self.assertGreater(improve.sweepNumber, 2)
+        self.assertLessEqual(len(VImproved['alpha']), self.B.shape[0])
+        self.assertGreater(improve.prunedNumber, 0)
+        
+    @data(1, 3)
+    def testImproveMaxSweeps(self, maxSweeps):
+        improve=targetCode.Improve(self.backupEngine, epsilon=1e-12, maxSweeps=maxSweeps)
+        improve(self.V, self.B)
+        self.assertEqual(improve.sweepNumber, maxSweeps)
+        
+    def testSolveYieldsImprovingValueFunctions(self):
+        pbvi=targetCode.PBVI(targetCode.Improve(self.backupEngine, epsilon=0.1), self.expand, targetCode.getPolicy, self.V, 3)
+        values=[np.dot(self.B, V['alpha'].T).max(axis=1) for V in pbvi.solve(self.B[:1])]
+        self.assertEqual(len(values), 3)
+        for previous, current in zip(values, values[1:]):
+            self.assertTrue((current >= previous-1e-9).all())
+            
+    def testZeroTimeBudgetReturnsInitialValueFunction(self):
+        improve=targetCode.Improve(self.backupEngine, epsilon=0.1)
+        pbvi=targetCode.PBVI(improve, self.expand, targetCode.getPolicy, self.V, 3, timeBudget=0)
+        calculatedResult=pbvi(self.B[:1])
+        assert_almost_equal(calculatedResult['alpha'], self.V['alpha'])
+        self.assertEqual(improve.sweepNumber, 0)
+        
+    def tearDown(self):
+        pass
+
+
 @ddt
 class TestEvaluateAction(unittest.TestCase):
     
@@ -324,5 +1147,189 @@ class TestEvaluateAction(unittest.TestCase):
 
 
 
+@ddt
+class TestPrecision(unittest.TestCase):
+    
+    def setUp(self):
+        self.transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                        [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        self.rewardMatrix=np.array([[[-100, -100], [10, 10],     [-1, -1]],
+                                    [[10, 10],     [-100, -100], [-1, -1]]])
+        self.observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                         [[0, 0, 1], [0, 0, 1], [0.15, 0.85, 0]]])
+        self.V={'action': 2, 'alpha': np.array([[-1000, -1000]])}
+        self.B=np.array([[0.5, 0.5]])
+        
+    def solver(self, dtype, **options):
+        model=targetCode.CompiledModel(self.transitionMatrix, self.rewardMatrix, self.observationMatrix, dtype)
+        se=targetCode.StateEstimator(model)
+        improve=targetCode.Improve(targetCode.BatchBackup(model, gamma=0.9), epsilon=0.1)
+        expand=targetCode.Expand(se, model, targetCode.furthestB)
+        return targetCode.PBVI(improve, expand, targetCode.getPolicy, self.V, 4, **options)
+        
+    def testFloat32PropagatesWithoutUpcasts(self):
+        pbvi=self.solver(np.float32)
+        V=pbvi(self.B)
+        self.assertEqual(pbvi.improve.dtype, np.float32)
+        self.assertEqual(V['alpha'].dtype, np.float32)
+        self.assertEqual(pbvi.state['B'].dtype, np.float32)
+        self.assertEqual(pbvi.expand.se.batchUpdate(self.B)['belief'].dtype, np.float32)
+        self.assertEqual(pbvi.improve.backupEngine(V, pbvi.state['B'])['alpha'].dtype, np.float32)
+        reference=self.solver(np.float64)
+        VReference=reference(self.B)
+        assert_almost_equal(np.dot(self.B, V['alpha'].T.astype(float)).max(), np.dot(self.B, VReference['alpha'].T).max(), 2)
+        
+    def testFloat64Verification(self):
+        verifyEngine=targetCode.BatchBackup(self.transitionMatrix, self.rewardMatrix, self.observationMatrix, 0.9)
+        pbvi=self.solver(np.float32, verifyEngine=verifyEngine)
+        V=pbvi(self.B)
+        self.assertEqual(pbvi.verification['value'].dtype, np.float64)
+        self.assertLess(pbvi.verification['roundingError'], 1e-3)
+        self.assertLess(pbvi.verification['bellmanResidual'], 10)
+        self.assertIsNone(self.solver(np.float32).verification)
+        
+    @data(4, 8)
+    def testMemoryBudgetCapsBeliefsAndAlphas(self, rowNumber):
+        pbvi=self.solver(np.float32, memoryBudget=rowNumber*2*4)
+        V=pbvi(self.B)
+        self.assertEqual(pbvi.expand.maxBeliefs, rowNumber//2)
+        self.assertLessEqual(pbvi.state['B'].shape[0], rowNumber//2)
+        self.assertLessEqual(len(V['alpha']), rowNumber-rowNumber//2)
+        self.assertGreater(pbvi.expand.droppedNumber+pbvi.improve.truncatedNumber, 0)
+        
+    @data(4, 8)
+    def testMemoryBudgetClampsBufferGrowth(self, rowNumber):
+        pbvi=self.solver(np.float32, memoryBudget=rowNumber*2*4)
+        V=pbvi(self.B)
+        self.assertLessEqual(pbvi.state['B'].buffer.shape[0], rowNumber//2)
+        self.assertLessEqual(V.alphaBuffer.shape[0], pbvi.improve.maxAlphas)
+        
+    @data(0, 1)
+    def testMemoryBudgetHoldsOnRandomModel(self, seed):
+        model=pomdpDomains.randomPOMDP(30, 4, 4, seed=seed)
+        compiled=targetCode.CompiledModel(model['transitionMatrix'], model['rewardMatrix'], model['observationMatrix'], np.float32)
+        improve=targetCode.Improve(targetCode.BatchBackup(compiled, gamma=model['gamma']), epsilon=0.1)
+        expand=targetCode.Expand(targetCode.StateEstimator(compiled), compiled, targetCode.furthestB)
+        V={'action': 0, 'alpha': np.full((1, 30), model['rewardMatrix'].min()/(1-model['gamma']))}
+        pbvi=targetCode.PBVI(improve, expand, targetCode.getPolicy, V, 5, memoryBudget=40*30*4)
+        V=pbvi(np.full((1, 30), 1/30))
+        self.assertEqual(improve.maxAlphas, 20)
+        self.assertLessEqual(V.alphaBuffer.shape[0]+pbvi.state['B'].buffer.shape[0], 40)
+        
+    @data((None, 6), (5, 5), (16, 6), (2, 4))
+    @unpack
+    def testReserveClampsToLimit(self, limit, expectedRows):
+        self.assertEqual(targetCode.reserve(np.zeros((3, 2)), 4, limit).shape[0], expectedRows)
+        
+    def testMaxAlphasHoldsEverySweep(self):
+        B=np.array([[0.05*n, 1-0.05*n] for n in range(21)])
+        improve=targetCode.Improve(targetCode.BatchBackup(self.transitionMatrix, self.rewardMatrix, self.observationMatrix, 0.9), 
+                                   epsilon=1e-6, maxSweeps=20, maxAlphas=2)
+        sizes=[]
+        backupBeliefs=improve.backupBeliefs
+        improve.backupBeliefs=lambda V, B: sizes.append(len(V['alpha'])) or backupBeliefs(V, B)
+        V=improve(self.V, B)
+        self.assertGreater(len(sizes), 2)
+        self.assertLessEqual(max(sizes), 2)
+        self.assertLessEqual(len(V), 2)
+        self.assertGreater(improve.truncatedNumber, 0)
+        
+    @data((np.array([[2, 5], [4, 9], [10, 0], [0, 12]]), np.array([[1, 0], [0.9, 0.1], [0, 1]]), 1, np.array([[10, 0]])),
+          (np.array([[2, 5], [4, 9], [10, 0], [0, 12]]), np.array([[1, 0], [0.9, 0.1], [0, 1]]), 2, np.array([[10, 0], [0, 12]])))
+    @unpack
+    def testTruncateKeepsMostUsedAlphas(self, alpha, B, maxNumber, expectedResult):
+        V=targetCode.ValueFunction(alpha, 0)
+        self.assertEqual(V.truncate(B, maxNumber), alpha.shape[0]-maxNumber)
+        assert_almost_equal(V['alpha'], expectedResult)
+               
+    def tearDown(self):
+        pass
+
+
+@ddt
+class TestBatchExpand(unittest.TestCase):
+    
+    def setUp(self):
+        transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                   [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        rewardMatrix=np.array([[[-100, -100], [10, 10],     [-1, -1]],
+                               [[10, 10],     [-100, -100], [-1, -1]]])
+        observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                    [[0, 0, 1], [0, 0, 1], [0.15, 0.85, 0]]])
+        self.model=targetCode.CompiledModel(transitionMatrix, rewardMatrix, observationMatrix)
+        self.se=targetCode.StateEstimator(self.model)
+        self.B=np.array([[0.5, 0.5], [0.85, 0.15], [0.3, 0.7]])
+        self.successors=self.se.batchUpdate(self.B)['belief'][self.se.batchUpdate(self.B)['possible']]
+        
+    def strategies(self, maxNewBeliefs):
+        listen=lambda B: np.full(B.shape[0], 2)
+        return [targetCode.StochasticExpand(self.se, maxNewBeliefs, seed=0, policy=listen), targetCode.TopKExpand(self.se, maxNewBeliefs),
+                targetCode.GreedyErrorExpand(self.se, 0.9, maxNewBeliefs)]
+        
+    @data(1, 2)
+    def testAddsAtMostCapNewSuccessors(self, maxNewBeliefs):
+        for expand in self.strategies(maxNewBeliefs):
+            calculatedResult=expand(self.B)
+            newBeliefs=calculatedResult[self.B.shape[0]:]
+            assert_almost_equal(calculatedResult[:self.B.shape[0]], self.B)
+            self.assertGreater(newBeliefs.shape[0], 0)
+            self.assertLessEqual(newBeliefs.shape[0], maxNewBeliefs)
+            self.assertTrue((targetCode.minL1Distance(newBeliefs, self.B) > 0).all())
+            self.assertTrue((targetCode.minL1Distance(newBeliefs, self.successors) < 1e-9).all())
+            
+    def testTopKPicksGloballyFurthest(self):
+        calculatedResult=targetCode.TopKExpand(self.se, 1)(self.B)[-1]
+        expectedResult=self.successors[np.argmax(targetCode.minL1Distance(self.successors, self.B))]
+        assert_almost_equal(calculatedResult, expectedResult)
+        
+    def testBlocksAreSizedByCandidateCount(self):
+        B=np.array([[0.05*n, 1-0.05*n] for n in range(21)])
+        strategies=[lambda blockSize: targetCode.TopKExpand(self.se, 1, blockSize=blockSize),
+                    lambda blockSize: targetCode.GreedyErrorExpand(self.se, 0.9, 1, blockSize=blockSize)]
+        for strategy in strategies:
+            expand=strategy(18)
+            blockSizes=[]
+            batchUpdate=expand.batchUpdate
+            expand.batchUpdate=lambda B: blockSizes.append(B.shape[0]) or batchUpdate(B)
+            calculatedResult=expand(B)
+            self.assertEqual(max(blockSizes), 2)
+            assert_almost_equal(calculatedResult, strategy(256)(B))
+            
+    @data(1, 5, 2**21)
+    def testNearestL1MatchesBruteForce(self, blockElements):
+        random=np.random.RandomState(1)
+        X, B=random.dirichlet(np.ones(3), 9), random.dirichlet(np.ones(3), 7)
+        distance=abs(X[:, np.newaxis, :]-B[np.newaxis, :, :]).sum(axis=2)
+        calculatedDistance, calculatedIndex=targetCode.nearestL1(X, B, 3, blockElements)
+        assert_almost_equal(calculatedDistance, distance.min(axis=1))
+        assert_almost_equal(calculatedIndex, distance.argmin(axis=1))
+        
+    def testParallelExpandRejectsBatchExpand(self):
+        with targetCode.WorkerPool(2, 'thread') as pool:
+            for expand in self.strategies(1):
+                with self.assertRaises(TypeError):
+                    targetCode.ParallelExpand(expand, pool)
+        
+    def testStochasticIsSeeded(self):
+        B=np.array([[0.05*n, 1-0.05*n] for n in range(21)])
+        first=targetCode.StochasticExpand(self.se, 5, seed=3)(B)
+        second=targetCode.StochasticExpand(self.se, 5, seed=3)(B)
+        assert_almost_equal(first, second)
+        self.assertEqual(targetCode.StochasticExpand(self.se, seed=3, policy=lambda B: np.zeros(B.shape[0], dtype=int))(B).shape[0], 
+                         B.shape[0])
+        
+    def testGreedyUsesSolvedValueInPBVI(self):
+        improve=targetCode.Improve(targetCode.BatchBackup(self.model, gamma=0.9), epsilon=1)
+        expand=targetCode.GreedyErrorExpand(self.se, 0.9, 2)
+        pbvi=targetCode.PBVI(improve, expand, targetCode.getPolicy, {'action': 2, 'alpha': np.array([[-1000, -1000]])}, 3)
+        pbvi(np.array([[0.5, 0.5]]))
+        self.assertIs(expand.V, pbvi.state['V'])
+        self.assertLessEqual(pbvi.state['B'].shape[0], 1+3*2)
+        self.assertGreater(pbvi.state['B'].shape[0], 1)
+               
+    def tearDown(self):
+        pass
+
+
 if __name__ == '__main__':
 	unittest.main(verbosity=2)
@@ -0,0 +1,95 @@
+
+
+import sys
+sys.path.append('../src/')
+import numpy as np
+
+import unittest
+from numpy.testing import assert_almost_equal
+from ddt import ddt, data, unpack
+import pomdpNumpy
+import pomdpDomains
+import pomdpSimulation as targetCode
+
+@ddt
+class TestSimulator(unittest.TestCase):
+    
+    def setUp(self):
+        model=pomdpDomains.tiger(0.9)
+        self.simulator=targetCode.Simulator(model['transitionMatrix'], model['rewardMatrix'], model['observationMatrix'], 
+                                            model['gamma'])
+        self.initialBelief=np.array([0.5, 0.5])
+        self.listen={'action': np.array([2]), 'alpha': np.array([[0, 0]])}
+        
+    @data((np.array([[0.3, 0.7, 0], [0, 0, 1], [0.5, 0.5, 0]]), np.array([1, 2, 0, 1, 2])))
+    @unpack
+    def testSampleRowsFollowsDistribution(self, probability, rows):
+        random=np.random.default_rng(0)
+        samples=np.array([targetCode.sampleRows(random, probability[rows]) for n in range(2000)])
+        self.assertTrue((samples[:, 0] == 2).all())
+        self.assertFalse((samples[:, 2] == 2).any())
+        self.assertAlmostEqual((samples[:, 1] == 0).mean(), 0.5, delta=0.05)
+        self.assertAlmostEqual((samples[:, 2] == 0).mean(), 0.3, delta=0.05)
+        
+    @data(1, 5, 20)
+    def testDeterministicReturn(self, horizon):
+        result=self.simulator.evaluate(self.listen, self.initialBelief, 50, horizon)
+        expectedResult=-(1-0.9**horizon)/(1-0.9)
+        self.assertAlmostEqual(result['mean'], expectedResult)
+        assert_almost_equal(result['confidenceInterval'], [expectedResult, expectedResult])
+        
+    def testBeliefTrackingMatchesStateEstimator(self):
+        se=pomdpNumpy.StateEstimator(self.simulator.model)
+        B=np.array([[0.5, 0.5], [0.2, 0.8], [0.9, 0.1]])
+        actions=np.array([2, 0, 2])
+        observations=np.array([0, 2, 1])
+        calculatedResult=self.simulator.updateBeliefs(B.copy(), actions, observations)
+        assert_almost_equal(calculatedResult, [se(b, a, o) for b, a, o in zip(B, actions, observations)])
+        
+    @data(('thread', 2), ('process', 2))
+    @unpack
+    def testSeededAndIndependentOfWorkers(self, mode, workerNumber):
+        V={'action': np.array([0, 1, 2]), 'alpha': np.array([[-50, 10], [10, -50], [-1, -1]])}
+        serial=self.simulator.evaluate(V, self.initialBelief, 300, 10, seed=3, blockSize=64)
+        with pomdpNumpy.WorkerPool(workerNumber, mode) as pool:
+            parallel=self.simulator.evaluate(V, self.initialBelief, 300, 10, seed=3, pool=pool, blockSize=64)
+        assert_almost_equal(parallel['returns'], serial['returns'])
+        self.assertEqual(serial['returns'].size, 300)
+        different=self.simulator.evaluate(V, self.initialBelief, 300, 10, seed=4, blockSize=64)
+        self.assertFalse(np.allclose(different['returns'], serial['returns']))
+        
+    def testPoolSharesSimulatorOnce(self):
+        with pomdpNumpy.WorkerPool(2, 'process') as pool:
+            self.simulator.evaluate(self.listen, self.initialBelief, 20, 3, pool=pool)
+            executor=pool.executor
+            for seed in range(1, 3):
+                self.simulator.evaluate(self.listen, self.initialBelief, 20, 3, seed=seed, pool=pool)
+            self.assertEqual(len(pool.sharedObjects), 1)
+            self.assertIs(pool.executor, executor)
+        
+    def testSolvedPolicyBeatsListening(self):
+        model=self.simulator.model
+        improve=pomdpNumpy.Improve(pomdpNumpy.BatchBackup(model, gamma=0.9), epsilon=0.01)
+        B=np.array([[0.05*n, 1-0.05*n] for n in range(21)])
+        V=improve({'action': 2, 'alpha': np.array([[-1000, -1000]])}, B)
+        solved=self.simulator.evaluate(V, self.initialBelief, 2000, 30)
+        listening=self.simulator.evaluate(self.listen, self.initialBelief, 2000, 30)
+        self.assertGreater(solved['confidenceInterval'][0], listening['confidenceInterval'][1])
+        self.assertLess(solved['confidenceInterval'][0], solved['mean'])
+        
+    def testCompareSolversRanksPolicies(self):
+        improve=pomdpNumpy.Improve(pomdpNumpy.BatchBackup(self.simulator.model, gamma=0.9), epsilon=0.01)
+        V={'action': 2, 'alpha': np.array([[-1000, -1000]])}
+        solvers={'listen': lambda B: self.listen, 'converged': lambda B: improve(V, B)}
+        B=np.array([[0.05*n, 1-0.05*n] for n in range(21)])
+        results=targetCode.compareSolvers(self.simulator, solvers, B, self.initialBelief, 500, 20)
+        self.assertEqual([result['solver'] for result in results], ['listen', 'converged'])
+        self.assertGreater(results[1]['mean'], results[0]['mean'])
+        self.assertTrue(all(result['solveCpuSeconds'] >= 0 for result in results))
+               
+    def tearDown(self):
+        pass
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
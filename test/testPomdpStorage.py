@@ -0,0 +1,89 @@
+
+
+import sys
+sys.path.append('../src/')
+import json
+import os
+import tempfile
+import numpy as np
+
+import unittest
+from numpy.testing import assert_almost_equal
+from ddt import ddt, data, unpack
+import pomdpNumpy
+import pomdpStorage as targetCode
+
+@ddt
+class TestStorage(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory=tempfile.TemporaryDirectory()
+        self.path=os.path.join(self.directory.name, 'stored')
+        
+    def testModelRoundTrip(self):
+        transitionMatrix=np.array([[[0.5, 0.5], [0.5, 0.5], [1, 0]],
+                                   [[0.5, 0.5], [0.5, 0.5], [0, 1]]])
+        rewardMatrix=np.array([[[-100, -100], [10, 10],     [-1, -1]],
+                               [[10, 10],     [-100, -100], [-1, -1]]])
+        observationMatrix=np.array([[[0, 0, 1], [0, 0, 1], [0.85, 0.15, 0]],
+                                    [[0, 0, 1], [0, 0, 1], [0.15, 0.85, 0]]])
+        for reward in [rewardMatrix, (rewardMatrix*transitionMatrix).sum(axis=2)]:
+            targetCode.saveModel(self.path, transitionMatrix=transitionMatrix, rewardMatrix=reward, 
+                                 observationMatrix=observationMatrix)
+            model=targetCode.loadModel(self.path)
+            self.assertIsInstance(model['transitionMatrix'], np.memmap)
+            assert_almost_equal(model['transitionMatrix'], transitionMatrix)
+            assert_almost_equal(model['observationMatrix'], observationMatrix)
+            assert_almost_equal(model['rewardMatrix'], reward)
+            self.assertEqual(model['rewardMatrix'].dtype, reward.dtype)
+            compiled=pomdpNumpy.CompiledModel(model['transitionMatrix'], model['rewardMatrix'], model['observationMatrix'])
+            assert_almost_equal(compiled.oneStepReward, (rewardMatrix*transitionMatrix).sum(axis=2))
+            
+    def testSaveModelRejectsPositionalAndBadRewards(self):
+        transitionMatrix=np.full((2, 1, 2), 0.5)
+        observationMatrix=np.full((2, 1, 2), 0.5)
+        with self.assertRaises(TypeError):
+            targetCode.saveModel(self.path, transitionMatrix, observationMatrix, observationMatrix)
+        with self.assertRaises(ValueError):
+            targetCode.saveModel(self.path, transitionMatrix=transitionMatrix, rewardMatrix=np.zeros((2, 2)), 
+                                 observationMatrix=observationMatrix)
+        
+    @data(np.array([[0.2, 0.8], [0.5, 0.5]], dtype=np.float32))
+    def testBeliefsRoundTrip(self, B):
+        targetCode.saveBeliefs(self.path, pomdpNumpy.BeliefSet(B))
+        calculatedResult=targetCode.loadBeliefs(self.path)
+        self.assertIsInstance(calculatedResult, np.memmap)
+        self.assertEqual(calculatedResult.dtype, np.float32)
+        assert_almost_equal(calculatedResult, B)
+        
+    @data(({'action': np.array([2, 0, 2, 1]), 'alpha': np.array([[2, 5], [4, 9], [3, 6], [5, 7]], dtype=float)},
+           np.array([[0.9, 0.1], [0.5, 0.5], [0.2, 0.8]])))
+    @unpack
+    def testValueFunctionRoundTripIsQueryable(self, V, B):
+        targetCode.saveValueFunction(self.path, V)
+        loaded=targetCode.loadValueFunction(self.path)
+        self.assertIsInstance(loaded['alpha'], np.memmap)
+        assert_almost_equal([pomdpNumpy.getPolicy(loaded, b) for b in B], [pomdpNumpy.getPolicy(V, b) for b in B])
+        policy=pomdpNumpy.CompiledPolicy(loaded)
+        self.assertTrue(np.shares_memory(policy.alpha, loaded['alpha']))
+        assert_almost_equal(policy.qValues(B), pomdpNumpy.CompiledPolicy(V).qValues(B))
+        
+    def testRejectsWrongKindAndVersion(self):
+        targetCode.saveBeliefs(self.path, np.array([[0.2, 0.8]]))
+        with self.assertRaises(ValueError):
+            targetCode.loadValueFunction(self.path)
+        headerPath=os.path.join(self.path, targetCode.headerName)
+        with open(headerPath) as f:
+            header=json.load(f)
+        header['version']=targetCode.formatVersion+1
+        with open(headerPath, 'w') as f:
+            json.dump(header, f)
+        with self.assertRaises(ValueError):
+            targetCode.loadBeliefs(self.path)
+               
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -0,0 +1,111 @@
+
+
+import sys
+sys.path.append('../src/')
+import asyncio
+import numpy as np
+
+import unittest
+from numpy.testing import assert_almost_equal
+from ddt import ddt, data, unpack
+import pomdpNumpy
+import pomdpTracker as targetCode
+
+@ddt
+class TestBeliefTracker(unittest.TestCase):
+    
+    def setUp(self):
+        self.transitionMatrix=np.array([[[0, 0.5, 0.5], [1, 0, 0]],
+                                        [[0.3, 0, 0.7], [0, 1, 0]],
+                                        [[0.8, 0.2, 0], [0, 0, 1]]])
+        self.observationMatrix=np.array([[[0.5, 0.5, 0], [0, 0, 1]],
+                                         [[0.1, 0.9, 0], [0, 1, 0]],
+                                         [[0.9, 0.1, 0], [1, 0, 0]]])
+        self.se=pomdpNumpy.StateEstimator(self.transitionMatrix, self.observationMatrix)
+        self.policy=pomdpNumpy.CompiledPolicy({'action': np.array([0, 1]), 'alpha': np.array([[1, 0, 0], [0, 1, 1]])})
+        self.initialBelief=np.array([0.1, 0.5, 0.4])
+        
+    def testUpdateMatchesStateEstimator(self):
+        tracker=targetCode.BeliefTracker(self.transitionMatrix, self.observationMatrix, self.policy, self.initialBelief, 2)
+        events=[('a', 0, 1), ('b', 1, 2), ('c', 0, 0), ('a', 1, 1), ('a', 0, 0), ('b', 0, 1)]
+        expectedResult={}
+        for sessionId in 'abc':
+            tracker.addSession(sessionId)
+            expectedResult[sessionId]=self.initialBelief
+        for sessionId, a, o in events:
+            expectedResult[sessionId]=self.se(expectedResult[sessionId], a, o)
+        decisions=tracker.update(events)
+        for sessionId in 'abc':
+            assert_almost_equal(tracker.belief(sessionId), expectedResult[sessionId])
+            self.assertEqual(decisions[sessionId], self.policy(expectedResult[sessionId]))
+        self.assertEqual(tracker.updateNumber, len(events))
+        
+    def testRemovedSlotIsReusedInPlace(self):
+        tracker=targetCode.BeliefTracker(self.transitionMatrix, self.observationMatrix, self.policy, self.initialBelief, 2)
+        tracker.addSession('a')
+        slot=tracker.addSession('b')
+        buffer=tracker.buffer
+        tracker.update([('b', 0, 1)])
+        tracker.removeSession('b')
+        self.assertEqual(tracker.addSession('c'), slot)
+        self.assertIs(tracker.buffer, buffer)
+        assert_almost_equal(tracker.belief('c'), self.initialBelief)
+        self.assertNotIn('b', tracker)
+        self.assertEqual(len(tracker), 2)
+        
+    @data(('reset', np.array([0.1, 0.5, 0.4])), ('predict', np.array([0, 0.5, 0.5])), ('keep', np.array([1, 0, 0])))
+    @unpack
+    def testImpossibleObservationRecovery(self, recovery, expectedResult):
+        tracker=targetCode.BeliefTracker(self.transitionMatrix, self.observationMatrix, self.policy, self.initialBelief, 
+                                         recovery=recovery)
+        tracker.addSession('a', np.array([1, 0, 0]))
+        tracker.addSession('b', np.array([1, 0, 0]))
+        tracker.update([('a', 0, 2), ('b', 0, 1)])
+        assert_almost_equal(tracker.belief('a'), expectedResult)
+        assert_almost_equal(tracker.belief('b'), self.se(np.array([1, 0, 0]), 0, 1))
+        self.assertEqual(tracker.impossibleNumber, 1)
+        
+    def testImpossibleObservationRaises(self):
+        tracker=targetCode.BeliefTracker(self.transitionMatrix, self.observationMatrix, self.policy, self.initialBelief, 
+                                         recovery='raise')
+        tracker.addSession('a', np.array([1, 0, 0]))
+        with self.assertRaises(ValueError):
+            tracker.update([('a', 1, 0)])
+            
+    def testRaiseLeavesEveryBeliefUntouched(self):
+        tracker=targetCode.BeliefTracker(self.transitionMatrix, self.observationMatrix, self.policy, self.initialBelief, 
+                                         recovery='raise')
+        tracker.addSession('a', np.array([1, 0, 0]))
+        tracker.addSession('b', np.array([1, 0, 0]))
+        with self.assertRaises(ValueError):
+            tracker.update([('a', 0, 1), ('b', 0, 1), ('a', 1, 1), ('b', 1, 2)])
+        assert_almost_equal(tracker.belief('a'), np.array([1, 0, 0]))
+        assert_almost_equal(tracker.belief('b'), np.array([1, 0, 0]))
+        self.assertEqual(tracker.updateNumber, 0)
+            
+    @data(1, 4, 256)
+    def testStreamYieldsDecisions(self, maxBatch):
+        tracker=targetCode.BeliefTracker(self.transitionMatrix, self.observationMatrix, self.policy, self.initialBelief)
+        events=[(n%5, n%2, 1) for n in range(20)]
+        for sessionId in range(5):
+            tracker.addSession(sessionId)
+            
+        async def eventStream():
+            for event in events:
+                yield event
+                
+        async def collect():
+            return [decision async for decision in tracker.stream(eventStream(), maxBatch)]
+        
+        decisions=asyncio.run(collect())
+        self.assertEqual(tracker.updateNumber, len(events))
+        self.assertEqual(set(sessionId for sessionId, action in decisions), set(range(5)))
+        self.assertGreaterEqual(len(decisions), 5)
+        self.assertEqual(dict(decisions), tracker.decide(list(range(5))))
+               
+    def tearDown(self):
+        pass
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)